@@ -3,12 +3,13 @@ import sys
 
 PACKAGE_PARENT = '..'
 SCRIPT_DIR = os.path.dirname(os.path.realpath(os.path.join(os.getcwd(), os.path.expanduser(__file__))))
-print(SCRIPT_DIR)
 sys.path.append(os.path.normpath(os.path.join(SCRIPT_DIR, PACKAGE_PARENT)))
-print(sys.path)
 
 from .aros import AROS
 
 def main():
     aros = AROS()
     aros.run()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,427 @@
+import os
+import json
+import mmap
+import zlib
+import struct
+import hashlib
+
+from .maps import Map, Room
+from .lazy import LazyRoll
+from .results import RollResult
+
+MAGIC = b'AROSMAP1'
+# bump whenever the layout of a record or the index changes
+format_version = 1
+
+# index entries are (key hash, record offset, record length), sorted by key hash so lookups can bisect the mmap
+INDEX_ENTRY = struct.Struct('>QQI')
+# the footer is the index offset, the entry count and the magic again, so truncated files are caught
+FOOTER = struct.Struct('>QQ8s')
+LENGTH = struct.Struct('>I')
+
+# value tags
+NONE = 0
+FALSE = 1
+TRUE = 2
+INT = 3
+FLOAT = 4
+STR = 5
+STR_REF = 6
+LIST = 7
+DICT = 8
+NODE = 9
+RECORD = 10
+RESULT = 11
+RESULT_REF = 12
+
+def archive_key(depth, seed):
+    digest = hashlib.blake2b(('%s\0%s' % (depth, seed)).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+def write_varint(out, n):
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+def zigzag(n):
+    return n * 2 if n >= 0 else -n * 2 - 1
+
+def unzigzag(n):
+    return n >> 1 if not n & 1 else -(n >> 1) - 1
+
+class ConfigIndex():
+    """Numbers every dict and list of the config in walk order, so records point at table entries by ID.
+
+    The walk only depends on the config, so the IDs are the same in every
+    process that loaded the same config hash.
+    """
+    def __init__(self, aros):
+        self.aros = aros
+        self.nodes = []
+        self.ids = {}
+        # plain name entries are rolled as record dicts made by their weighted table, as id -> (list ID, position)
+        self.records = {}
+        # weighted tables indexed into records so far, tables are only ever added
+        self.indexed = 0
+
+        stack = [aros.config]
+        while stack:
+            node = stack.pop()
+            if id(node) in self.ids:
+                continue
+
+            self.ids[id(node)] = len(self.nodes)
+            self.nodes.append(node)
+
+            children = node.values() if isinstance(node, dict) else node
+            stack.extend(reversed([c for c in children if isinstance(c, (dict, list))]))
+
+    def node_id(self, node):
+        return self.ids.get(id(node))
+
+    # only tables compiled since the last miss are scanned, so dicts that aren't records cost one lookup
+    def record_ref(self, record):
+        ref = self.records.get(id(record))
+        if ref is None and len(self.aros.weighted_tables) != self.indexed:
+            self.index_records()
+            ref = self.records.get(id(record))
+
+        return ref
+
+    def index_records(self):
+        tables = list(self.aros.weighted_tables.values())
+        for weighted in tables[self.indexed:]:
+            list_id = self.ids.get(id(weighted.entries))
+            if list_id is None:
+                continue
+            for n, entry in enumerate(weighted.entries):
+                if weighted.records[n] is not entry:
+                    self.records[id(weighted.records[n])] = (list_id, n)
+
+        self.indexed = len(tables)
+
+    def record(self, list_id, n):
+        return self.aros.weighted_table(self.nodes[list_id]).records[n]
+
+class Encoder():
+    """Writes one map as a record: its room grid, hall masks and rolled results as config references."""
+    def __init__(self, index):
+        self.index = index
+
+    def encode(self, map):
+        out = bytearray()
+        self.strings = {}
+        self.results = {}
+
+        write_varint(out, map.size)
+        write_varint(out, zigzag(map.exit))
+        write_varint(out, len(map.rooms))
+        for room in map.rooms:
+            write_varint(out, room.index)
+            write_varint(out, room.x)
+            write_varint(out, room.y)
+            write_varint(out, room.distance)
+            write_varint(out, zigzag(room.hallways))
+            write_varint(out, 0 if room.exit is None else room.exit + 1)
+            out.append(map.hall_mask(room.x, room.y))
+            self.value(out, room.location)
+            self.value(out, room.situation)
+
+        head = bytearray()
+        self.string(head, map.depth)
+        self.string(head, map.seed)
+
+        # depth and seed stay outside the compressed body so lookups can check them cheaply
+        return bytes(head) + zlib.compress(bytes(out))
+
+    def string(self, out, value):
+        data = value.encode('utf-8')
+        write_varint(out, len(data))
+        out += data
+
+    def value(self, out, value):
+        if isinstance(value, LazyRoll):
+            value = value.resolve()
+
+        if value is None:
+            out.append(NONE)
+        elif value is True:
+            out.append(TRUE)
+        elif value is False:
+            out.append(FALSE)
+        elif isinstance(value, int):
+            out.append(INT)
+            write_varint(out, zigzag(value))
+        elif isinstance(value, float):
+            out.append(FLOAT)
+            out += struct.pack('>d', value)
+        elif isinstance(value, str):
+            # repeated strings in a record are written once
+            n = self.strings.get(value)
+            if n is not None:
+                out.append(STR_REF)
+                write_varint(out, n)
+            else:
+                self.strings[value] = len(self.strings)
+                out.append(STR)
+                self.string(out, value)
+        elif isinstance(value, RollResult):
+            # results are listed under both results and their type, so later sightings point back
+            n = self.results.get(id(value))
+            if n is not None:
+                out.append(RESULT_REF)
+                write_varint(out, n)
+                return
+            self.results[id(value)] = len(self.results)
+
+            out.append(RESULT)
+            self.value(out, value.entry)
+            write_varint(out, 0 if value.die is None else value.die + 1)
+            self.value(out, value.table)
+            self.value(out, value.fields)
+        elif self.index.node_id(value) is not None:
+            out.append(NODE)
+            write_varint(out, self.index.node_id(value))
+        elif isinstance(value, dict):
+            ref = self.index.record_ref(value)
+            if ref is not None:
+                out.append(RECORD)
+                write_varint(out, ref[0])
+                write_varint(out, ref[1])
+                return
+
+            out.append(DICT)
+            write_varint(out, len(value))
+            for key, item in value.items():
+                self.value(out, key)
+                self.value(out, item)
+        elif isinstance(value, list):
+            out.append(LIST)
+            write_varint(out, len(value))
+            for item in value:
+                self.value(out, item)
+        else:
+            raise TypeError('unable to archive %s' % type(value).__name__)
+
+class Decoder():
+    """Reads records written by Encoder back into maps that print and export like generated ones."""
+    def __init__(self, index):
+        self.index = index
+
+    def head(self, data):
+        self.data = data
+        self.pos = 0
+        return self.string(), self.string()
+
+    def decode(self, data):
+        depth, seed = self.head(data)
+        self.data = zlib.decompress(data[self.pos:])
+        self.pos = 0
+        self.strings = []
+        self.results = []
+
+        size = self.varint()
+        map = Map(depth, seed, size, exit=unzigzag(self.varint()))
+        map.retries = 0
+
+        for n in range(self.varint()):
+            index = self.varint()
+            x = self.varint()
+            y = self.varint()
+            distance = self.varint()
+            hallways = unzigzag(self.varint())
+            exit = self.varint()
+            halls = self.data[self.pos]
+            self.pos += 1
+            location = self.value()
+            situation = self.value()
+
+            room = Room(index, location, situation=situation, hallways=hallways, distance=distance, exit=exit - 1 if exit else None)
+            map.add(room, x, y)
+            map.halls[y * size + x] = halls
+
+        return map
+
+    def varint(self):
+        data = self.data
+        n = 0
+        shift = 0
+        while True:
+            b = data[self.pos]
+            self.pos += 1
+            n |= (b & 0x7f) << shift
+            if b < 0x80:
+                return n
+            shift += 7
+
+    def string(self):
+        length = self.varint()
+        value = bytes(self.data[self.pos:self.pos + length]).decode('utf-8')
+        self.pos += length
+        return value
+
+    def value(self):
+        tag = self.data[self.pos]
+        self.pos += 1
+
+        if tag == NONE:
+            return None
+        if tag == TRUE:
+            return True
+        if tag == FALSE:
+            return False
+        if tag == INT:
+            return unzigzag(self.varint())
+        if tag == FLOAT:
+            value = struct.unpack_from('>d', self.data, self.pos)[0]
+            self.pos += 8
+            return value
+        if tag == STR:
+            value = self.string()
+            self.strings.append(value)
+            return value
+        if tag == STR_REF:
+            return self.strings[self.varint()]
+        if tag == RESULT:
+            result = RollResult(None)
+            # the result is listed before its fields are read, since they can point back at it
+            self.results.append(result)
+            result.entry = self.value()
+            die = self.varint()
+            result.die = die - 1 if die else None
+            result.table = self.value()
+            result.fields = self.value()
+            return result
+        if tag == RESULT_REF:
+            return self.results[self.varint()]
+        if tag == NODE:
+            return self.index.nodes[self.varint()]
+        if tag == RECORD:
+            list_id = self.varint()
+            return self.index.record(list_id, self.varint())
+        if tag == DICT:
+            value = {}
+            for n in range(self.varint()):
+                key = self.value()
+                value[key] = self.value()
+            return value
+        if tag == LIST:
+            return [self.value() for n in range(self.varint())]
+
+        raise ValueError('unknown archive value tag %s at %s' % (tag, self.pos - 1))
+
+class ArchiveWriter():
+    """Writes records to a temporary file, then the sorted index and footer, and moves it into place on close."""
+    def __init__(self, path, header):
+        import tempfile
+
+        self.path = path
+        self.index = []
+
+        fd, self.tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.archive-', suffix='.tmp')
+        self.file = os.fdopen(fd, 'wb')
+
+        header = json.dumps(dict(header, format=format_version), sort_keys=True).encode('utf-8')
+        self.file.write(MAGIC + LENGTH.pack(len(header)) + header)
+        self.offset = len(MAGIC) + LENGTH.size + len(header)
+
+    # records are length prefixed, so the archive can also be streamed in the order it was written
+    def add(self, depth, seed, record):
+        self.file.write(LENGTH.pack(len(record)))
+        self.file.write(record)
+        self.index.append((archive_key(depth, seed), self.offset + LENGTH.size, len(record)))
+        self.offset += LENGTH.size + len(record)
+
+    def close(self):
+        self.index.sort()
+        for entry in self.index:
+            self.file.write(INDEX_ENTRY.pack(*entry))
+        self.file.write(FOOTER.pack(self.offset, len(self.index), MAGIC))
+        self.file.close()
+        os.replace(self.tmp, self.path)
+
+    def abort(self):
+        self.file.close()
+        os.unlink(self.tmp)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.close()
+        else:
+            self.abort()
+
+class ArchiveReader():
+    """A memory mapped archive, looked up by (depth, seed) through its sorted index or streamed in order."""
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise ValueError('%s is empty' % path)
+
+        if self.data[:len(MAGIC)] != MAGIC or len(self.data) < len(MAGIC) + LENGTH.size + FOOTER.size:
+            self.close()
+            raise ValueError('%s is not a map archive' % path)
+
+        self.index_offset, self.count, magic = FOOTER.unpack_from(self.data, len(self.data) - FOOTER.size)
+        if magic != MAGIC or self.index_offset + self.count * INDEX_ENTRY.size != len(self.data) - FOOTER.size:
+            self.close()
+            raise ValueError('%s is truncated' % path)
+
+        length = LENGTH.unpack_from(self.data, len(MAGIC))[0]
+        self.records_offset = len(MAGIC) + LENGTH.size + length
+        self.header = json.loads(self.data[len(MAGIC) + LENGTH.size:self.records_offset].decode('utf-8'))
+
+    def entry(self, n):
+        return INDEX_ENTRY.unpack_from(self.data, self.index_offset + n * INDEX_ENTRY.size)
+
+    # the record for a depth and seed, or None
+    def find(self, depth, seed, decoder):
+        key = archive_key(depth, seed)
+
+        low = 0
+        high = self.count
+        while low < high:
+            mid = (low + high) // 2
+            if self.entry(mid)[0] < key:
+                low = mid + 1
+            else:
+                high = mid
+
+        # key hashes can collide, so every entry with the hash is checked against the record's own depth and seed
+        while low < self.count:
+            entry_key, offset, length = self.entry(low)
+            if entry_key != key:
+                break
+            record = self.data[offset:offset + length]
+            if decoder.head(record) == (depth, seed):
+                return record
+            low += 1
+
+        return None
+
+    # records in the order they were written
+    def __iter__(self):
+        offset = self.records_offset
+        while offset < self.index_offset:
+            length = LENGTH.unpack_from(self.data, offset)[0]
+            offset += LENGTH.size
+            yield self.data[offset:offset + length]
+            offset += length
+
+    def close(self):
+        if getattr(self, 'data', None) is not None:
+            self.data.close()
+            self.data = None
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
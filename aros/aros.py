@@ -1,15 +1,22 @@
 import os
 import sys
-import importlib
-import pkg_resources
-import json
-import argparse
-from ruamel import yaml
 import random
-import textwrap
-from datetime import datetime
+from collections.abc import Mapping
 
 from .logger import Logger
+from .cache import ConfigCache
+from .tables import WeightedTable
+from .context import GenerationContext, RNG_VERSIONS
+from .render import TileRenderer
+from .lazy import LazyRoll
+from .maps import Map, Room, MapConstraints, DIRECTIONS, HALL_BITS
+from .results import RollResult, MISSING, json_default
+from .rolls import compile_rolls, rollable, TablePath
+from .overlay import ConfigLayers, config_ids
+
+SEED_CHARS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+# records the generate command rolls in process unless --workers is given, a pool starts and loads the config per worker
+GENERATE_POOL_MIN = 10000
 
 class BC:
     PURPLE = '\033[95m'
@@ -22,13 +29,22 @@ class BC:
     UNDERLINE = '\033[4m'
 
 class AROS():
+    valid_dice = (
+        2,
+        3,
+        4,
+        6,
+        8,
+        10,
+        12,
+        20,
+        100,
+    )
+
     def __init__(self, args=None, init=True):
         if not init:
             return
 
-        self.datetime = datetime
-        self.version = pkg_resources.get_distribution('aros').version
-
         if args == None:
             self.args = vars(self.load_arguments())
         else:
@@ -55,7 +71,8 @@ class AROS():
         ]
 
         logger_params = {
-            'level': self.args['log_level']
+            'level': self.args['log_level'],
+            'history': self.args.get('log_history') or 0,
         }
         if os.getenv('DEBUG'):
             logger_params['level'] = 'debug'
@@ -65,20 +82,33 @@ class AROS():
             self.logger.log(self.version)
             sys.exit(0)
 
-        self.logger.log('AROS version: %s' % self.version, level='debug')
-        self.logger.log('Args: %s' % json.dumps(self.args, indent=2, default=str), level='debug')
+        self.logger.log(lambda: 'AROS version: %s' % self.version, level='debug')
+        self.logger.log(lambda: 'Args: %s' % self.dump(self.args), level='debug')
+
+        self.timings = None
+        if self.args.get('timings'):
+            from .timings import Timings
+
+            self.timings = Timings()
+            self.timings.instrument(self)
 
-        self.config = yaml.load(open(self.args['config']), Loader=yaml.Loader)
+        self.config_cache = ConfigCache(cache_dir=self.args.get('cache_dir'), logger=self.logger)
+        self.config_layers = ConfigLayers(self.config_paths(), self.load_config)
+        self.config_layers.refresh()
+        self.config, self.config_hash = self.config_layers.merged()
         # self.logger.log('Config: %s' % json.dumps(self.config, indent=2, default=str), level='debug')
         self.indent = self.config['options']['print_indent'] * ' '
-        self.vars = {}
+        # compiled lazily on first roll, keyed by id() of a table's entries list
+        self.weighted_tables = {}
+        self.compiled_rolls = {}
+        self.renderer = TileRenderer(self)
 
-        if 'seed' not in self.args or self.args['seed'] == '':
-            self.args['seed'] = ''.join(random.choice('0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz') for x in range(16))
+        # maps are only worth caching when the seed was chosen
+        self.seeded = bool(self.args.get('seed'))
+        if not self.seeded:
+            self.args['seed'] = self.new_seed(random)
 
-        self.random = random.Random(self.args['seed'])
         # random.seed(self.args['seed'])
-        self.logger.log('Seed: %s' % self.args['seed'])
 
         # for n in range(20):
         #     print(random.randint(1, 10))
@@ -92,210 +122,842 @@ class AROS():
         # print(BC.UNDERLINE + 'LOL')
         # sys.exit(0)
 
+    # defaults to the command line seed and options, pass a seed for a quiet standalone generation
+    def context(self, seed=None, spread=None, rolls_on=None, rng=None):
+        if rng is None:
+            rng = self.args.get('rng') or 'v1'
+
+        if seed is None:
+            seed = self.args['seed']
+            if spread is None:
+                spread = self.args['spread']
+            if rolls_on is None:
+                rolls_on = self.args['rolls_on']
+        elif not seed:
+            seed = self.new_seed(random)
+
+        return GenerationContext(seed, spread=spread or 0, rolls_on=rolls_on or False, rng=rng, timings=self.timings)
+
+    # only looked up when asked for, the package metadata is slow to load
+    @property
+    def version(self):
+        try:
+            from importlib.metadata import version
+        except ImportError:
+            import pkg_resources
+            return pkg_resources.get_distribution('aros').version
+
+        return version('aros')
+
+    def dump(self, data):
+        import json
+
+        return json.dumps(data, indent=2, default=json_default)
+
     def load_arguments(self):
+        import argparse
+
         parser = argparse.ArgumentParser(description='AROS options.')
 
-        parser.add_argument('command', metavar='<command>', type=str, help='options are: [generate]')
-        parser.add_argument('args', metavar='<args>', type=str, nargs='+', help='arguments for your chosen command')
+        parser.add_argument('command', metavar='<command>', type=str, help='options are: [roll,map,room,compile,serve,batch,odds,search,archive,shell,generate]')
+        parser.add_argument('args', metavar='<args>', type=str, nargs='*', help='arguments for your chosen command')
 
-        parser.add_argument('-c', '--config', default='%s/tables.yaml' % os.path.dirname(os.path.realpath(globals()['__file__'])), help='path to the config file')
+        parser.add_argument('-c', '--config', default=None, action='append', help='path to the config file, repeat it to merge overlays over the first file by table path, "default" is the bundled tables')
+        parser.add_argument('--cache_dir', default='', help='directory for the compiled config cache, defaults to $AROS_CACHE_DIR or ~/.cache/aros')
+        parser.add_argument('--no_cache', default=False, action='store_true', help='always parse the config yaml, bypassing the compiled cache')
         parser.add_argument('-l', '--log_level', default='info', help='set the desired logging level, options are: [info,debug,warn,error]')
+        parser.add_argument('--log_history', default=0, type=int, help='keep the last N log events at every level, printed to stderr if the command fails')
+        parser.add_argument('--timings', nargs='?', const='text', default=None, choices=['text', 'json'], help='print phase timings and roll counts to stderr when the command finishes')
+        parser.add_argument('--profile', default='', help='write a cProfile stats file for the command to this path')
         parser.add_argument('-r', '--rolls_on', default=False, action='store_true', help='show rolled values')
         parser.add_argument('-s', '--seed', default='', help='sets the random generator seed')
         parser.add_argument('--spread', default=0, type=int, help='widens the option range for table rolls')
+        parser.add_argument('--rng', default='v1', choices=RNG_VERSIONS, help='random number scheme, v2 rolls each room from its own stream so the room command can roll it alone')
         parser.add_argument('-v', '--version', action='store_true', help='display the package version')
+        parser.add_argument('-a', '--advantage', default=None, type=int, help='overrides the advantage used by the odds command, from -3 to 3')
+        parser.add_argument('-n', '--count', default=None, type=int, help='number of maps for the batch command, seeds to try for the search command, or rolls to tally for the roll command')
+        parser.add_argument('--where', default='', help='python expression a map must satisfy for the search command, see the README for names')
+        parser.add_argument('--limit', default=1, type=int, help='number of matching seeds the search command stops at')
+        parser.add_argument('--format', default=None, choices=['text', 'json', 'jsonl', 'csv'], help='output format, text or json (one map per line) for maps read from an archive, jsonl (the default) or csv for the generate command')
+        parser.add_argument('-w', '--workers', default=None, type=int, help='number of worker processes for the batch, search and generate commands, defaults to the cpu count, generate rolls fewer than %s records in process by default' % GENERATE_POOL_MIN)
+        parser.add_argument('--map_cache', default=256, type=int, help='number of generated maps the serve command keeps in memory, 0 to turn it off')
+        parser.add_argument('--map_cache_disk', default=False, action='store_true', help='also keep generated maps on disk under the cache dir, for the map and serve commands')
+        parser.add_argument('--min_rooms', default=None, type=int, help='map constraint: reroll dead end rooms until the map has at least this many rooms')
+        parser.add_argument('--max_rooms', default=None, type=int, help='map constraint: stop adding rooms once the map has this many')
+        parser.add_argument('--exit_reachable', default=False, action='store_true', help='map constraint: reroll dead end rooms until a room reaches the exit distance')
+        parser.add_argument('--max_danger', default=None, type=int, help='map constraint: reroll rooms that would take the summed room danger over this')
+        parser.add_argument('--max_retries', default=20, type=int, help='number of room rerolls a constrained map can use before giving up')
+        parser.add_argument('--reload_interval', default=1.0, type=float, help='seconds between checks for config file changes in the serve and shell commands, 0 turns reloading off')
+        parser.add_argument('--host', default='127.0.0.1', help='address for the serve command to listen on')
+        parser.add_argument('--port', default=8080, type=int, help='port for the serve command to listen on')
 
         return parser.parse_args()
 
+    # the base config file and its overlays, in merge order
+    def config_paths(self):
+        default = '%s/tables.yaml' % os.path.dirname(os.path.realpath(globals()['__file__']))
+
+        paths = self.args.get('config') or [default]
+        if isinstance(paths, str):
+            paths = [paths]
+
+        return [default if path == 'default' else path for path in paths]
+
+    def load_config(self, path):
+        if self.args.get('no_cache'):
+            import hashlib
+
+            with open(path, 'rb') as f:
+                data = f.read()
+            return self.config_cache.parse(data), hashlib.sha256(data).hexdigest()
+
+        return self.config_cache.load(path)
+
+    def command_compile(self, args):
+        paths = args if args else self.config_layers.paths
+
+        for path in paths:
+            cache_path = self.config_cache.compile(path)
+            if cache_path is None:
+                self.logger.log('Unable to write compiled config for %s' % path, level='error')
+                sys.exit(1)
+            self.logger.log('Compiled %s -> %s' % (path, cache_path))
+
+    # a copy of this instance over the config files as they are now, or None when none of them changed
+    # the copy is swapped in whole, so generations already running on this instance keep its config
+    def reloaded(self):
+        try:
+            if not self.config_layers.refresh():
+                return None
+        except Exception as e:
+            self.logger.log('Unable to reload config, keeping the loaded one: %s' % e, level='error')
+            return None
+
+        config, config_hash = self.config_layers.merged()
+        if config_hash == self.config_hash:
+            return None
+
+        return self.with_config(config, config_hash)
+
+    def with_config(self, config, config_hash):
+        import copy
+
+        aros = copy.copy(self)
+        aros.config = config
+        aros.config_hash = config_hash
+        aros.indent = config['options']['print_indent'] * ' '
+        aros.renderer = TileRenderer(aros)
+
+        # only tables and rolls the new config still shares with this one stay compiled
+        # requests on this instance can still be compiling into the dicts, so they're copied before iterating
+        ids = config_ids(config)
+        aros.weighted_tables = {key: weighted for key, weighted in list(self.weighted_tables.items()) if key in ids}
+        aros.compiled_rolls = {}
+        for key, specs in list(self.compiled_rolls.items()):
+            if key in ids and self.specs_current(specs, config):
+                aros.compiled_rolls[key] = specs
+
+        if self.timings:
+            # the copy's instrumented methods are still bound to this instance
+            for name in self.timings.instrumented:
+                del aros.__dict__[name]
+            self.timings.instrument(aros)
+
+        return aros
+
+    # compiled roll specs resolve their static table paths up front, which a changed table elsewhere can make stale
+    def specs_current(self, specs, config):
+        for spec in specs:
+            if spec.tables is MISSING:
+                continue
+            for path in spec.tables:
+                if path.table is not None and TablePath(path.path, config['table']).table is not path.table:
+                    return False
+
+        return True
+
     def command_map(self, args):
-        self.vars['depth'] = args[0]
-        self.vars['depth_value'] = [d['name'] for d in self.config['depths']].index(self.vars['depth']) + 1
+        if not args:
+            self.logger.log('Invalid map command: needs a depth', level='error')
+            sys.exit(1)
 
-        map_size = self.config['options']['map_size']
-        plunge_row = self.config['options']['map_plunge_row']
-        plunge_col = self.config['options']['map_plunge_col']
-        half = int(map_size / 2)
-        exit_distance = self.roll_die(die=10, advantage=2)
+        self.logger.log('Seed: %s' % self.args['seed'])
+        ctx = self.context()
+        constraints = self.map_constraints()
 
-        rooms = []
-        for x in range(map_size):
-            rooms.append([{} for y in range(map_size)])
-
-        plunge = self.config['table']['environment'][self.vars['depth']]['plunge']
-
-        rooms[plunge_col][plunge_row] = {
-            'location': plunge,
-            'hallways': 1 if self.vars['depth'] == 'reef' else 3,
-            'exit': exit_distance,
-            'distance': 0,
-            'halls': [],
-            'index': 0,
+        if constraints is not None:
+            self.validate_depth(args[0])
+            map = self.generate_map(ctx, args[0], constraints=constraints)
+            self.print_map(map)
+
+            unmet = constraints.unmet(map)
+            if unmet:
+                self.logger.log('Constraints not met after %s retries: %s' % (map.retries, ', '.join(unmet)), level='warn')
+            else:
+                self.logger.log('Constraints met after %s retries' % map.retries)
+            return
+
+        # cached text is the info level output, rolled values and debug lines only show up when generating
+        if self.args.get('map_cache_disk') and self.seeded and not ctx.rolls_on and self.logger.level == 'info':
+            self.validate_depth(args[0])
+            cache = self.new_map_cache()
+            key = cache.key('text', args[0], ctx.seed, ctx.spread, ctx.rng, self.config_hash)
+            sys.stdout.write(cache.get(key, lambda: self.render_map(self.generate_map(ctx, args[0]))))
+            return
+
+        map = self.generate_map(ctx, args[0])
+        self.print_map(map)
+
+    # the map constraints from the command line, or None when none are set
+    def map_constraints(self):
+        args = self.args
+        if args.get('min_rooms') is None and args.get('max_rooms') is None and not args.get('exit_reachable') and args.get('max_danger') is None:
+            return None
+
+        max_retries = args.get('max_retries')
+        if max_retries is None:
+            max_retries = 20
+
+        return MapConstraints(
+            min_rooms=args.get('min_rooms'),
+            max_rooms=args.get('max_rooms'),
+            exit_reachable=args.get('exit_reachable'),
+            max_danger=args.get('max_danger'),
+            max_distance=self.config['options']['map_max_distance'],
+            max_retries=max_retries,
+        )
+
+    def new_map_cache(self):
+        from .mapcache import MapCache
+
+        cache_dir = None
+        if self.args.get('map_cache_disk'):
+            cache_dir = os.path.join(self.config_cache.cache_dir, 'maps')
+
+        max_entries = self.args.get('map_cache')
+        if max_entries is None:
+            max_entries = 256
+
+        return MapCache(max_entries=max_entries, cache_dir=cache_dir, logger=self.logger)
+
+    def command_room(self, args):
+        if self.args['rng'] == 'v1':
+            self.logger.log('The room command needs --rng v2, v1 rooms depend on every roll made before them', level='error')
+            sys.exit(1)
+
+        if len(args) < 2 or not args[1].isdigit():
+            self.logger.log('Invalid room command: needs a depth and a room index', level='error')
+            sys.exit(1)
+
+        depth = args[0]
+        self.validate_depth(depth)
+        index = int(args[1])
+
+        ctx = self.context()
+        rooms = self.room_count(ctx, depth)
+        if index >= rooms:
+            self.logger.log('Invalid room: %s, the map has %s rooms' % (index, rooms), level='error')
+            sys.exit(1)
+
+        self.logger.log('Seed: %s' % self.args['seed'])
+        room = self.generate_room(ctx, depth, index)
+        if room.exit is not None:
+            self.logger.log('Exit Distance: %s' % self.color(str(room.exit), BC.BOLD))
+        self.print_room_description(room)
+
+    def command_batch(self, args):
+        from .batch import Batch, generate_map
+
+        if not args or args[0] not in ['map']:
+            self.logger.log('Invalid batch command: %s, must be one of %s' % (args[0] if args else '', ['map']), level='error')
+            sys.exit(1)
+
+        if len(args) < 2:
+            self.logger.log('Invalid batch command: needs a depth', level='error')
+            sys.exit(1)
+
+        depth = args[1]
+        self.validate_depth(depth)
+
+        batch = Batch(self, workers=self.args['workers'])
+        count = self.args['count'] or 1
+        jobs = ((depth, seed, self.args['spread']) for seed in batch.seeds(count))
+
+        for n, line in enumerate(batch.map(generate_map, jobs)):
+            sys.stdout.write(line + '\n')
+            if n % 100 == 99:
+                sys.stdout.flush()
+        sys.stdout.flush()
+
+    def command_search(self, args):
+        import time
+        from .batch import Batch, search_map
+
+        if not args or args[0] not in ['map']:
+            self.logger.log('Invalid search command: %s, must be one of %s' % (args[0] if args else '', ['map']), level='error')
+            sys.exit(1)
+
+        if len(args) < 2:
+            self.logger.log('Invalid search command: needs a depth', level='error')
+            sys.exit(1)
+
+        depth = args[1]
+        self.validate_depth(depth)
+
+        where = self.args['where'] or 'True'
+        try:
+            compile(where, '<where>', 'eval')
+        except SyntaxError as e:
+            self.logger.log('Invalid --where expression: %s' % e, level='error')
+            sys.exit(1)
+
+        batch = Batch(self, workers=self.args['workers'])
+        count = self.args['count'] or 10000
+        jobs = ((depth, seed, self.args['spread'], where) for seed in batch.seeds(count))
+
+        started = time.perf_counter()
+        searched = 0
+        matches = 0
+        for seed, summary, error in batch.map(search_map, jobs):
+            searched += 1
+            if error:
+                self.logger.log('Invalid --where expression for seed %s: %s' % (seed, error), level='error')
+                sys.exit(1)
+
+            if summary:
+                matches += 1
+                self.logger.log('%s  %s' % (seed, summary))
+                if matches >= self.args['limit']:
+                    break
+
+        elapsed = time.perf_counter() - started
+        self.logger.log('Found %s of %s matches in %s seeds, %.1f seeds/second' % (matches, self.args['limit'], searched, searched / elapsed if elapsed else 0))
+
+    def command_archive(self, args):
+        subcommands = ['write', 'get', 'dump', 'info']
+        if not args or args[0] not in subcommands:
+            self.logger.log('Invalid archive command: %s, must be one of %s' % (args[0] if args else '', subcommands), level='error')
+            sys.exit(1)
+
+        if len(args) < 2:
+            self.logger.log('Invalid archive command: needs an archive path', level='error')
+            sys.exit(1)
+
+        if self.args.get('format') not in [None, 'text', 'json', 'jsonl']:
+            self.logger.log('Invalid format for the archive command: %s, must be one of %s' % (self.args['format'], ['text', 'json', 'jsonl']), level='error')
+            sys.exit(1)
+
+        getattr(self, 'archive_%s' % args[0])(args[1], args[2:])
+
+    def archive_write(self, path, depths):
+        import time
+        from .archive import ArchiveWriter
+        from .batch import Batch, archive_map
+
+        if not depths:
+            self.logger.log('Invalid archive command: needs at least one depth to write', level='error')
+            sys.exit(1)
+        for depth in depths:
+            self.validate_depth(depth)
+
+        batch = Batch(self, workers=self.args['workers'])
+        count = self.args['count'] or 1
+        jobs = ((depth, seed, self.args['spread']) for seed in batch.seeds(count) for depth in depths)
+        header = {
+            'config_hash': self.config_hash,
+            'rng': self.args['rng'],
+            'spread': self.args['spread'],
         }
 
-        self.room_list = [rooms[plunge_col][plunge_row]]
-        self.room_index = 0
+        started = time.perf_counter()
+        try:
+            with ArchiveWriter(path, header) as writer:
+                for depth, seed, record in batch.map(archive_map, jobs):
+                    writer.add(depth, seed, record)
+        except OSError as e:
+            self.logger.log('Unable to write archive %s: %s' % (path, e), level='error')
+            sys.exit(1)
+
+        elapsed = time.perf_counter() - started
+        self.logger.log('Archived %s maps to %s, %s bytes, %.1f maps/second' % (len(writer.index), path, os.path.getsize(path), len(writer.index) / elapsed if elapsed else 0))
 
-        if self.vars['depth'] == 'reef':
-            barrier_row = plunge_row + 1
-            barrier_col = plunge_col
-            rooms[plunge_col][plunge_row]['hallways'] = 0
-            rooms[plunge_col][plunge_row]['halls'] = ['S']
+    def open_archive(self, path):
+        from .archive import ArchiveReader, format_version
 
-            barrier = self.config['table']['environment']['reef']['great_barrier']
-            rooms[barrier_col][barrier_row] = {
-                'location': barrier,
-                'hallways': barrier['hallways'] - 1,
-                'distance': 0,  # technically should be 1, but reef maps are a little tight
-                'halls': ['N'],
-                'index': 1,
-            }
+        try:
+            archive = ArchiveReader(path)
+        except (OSError, ValueError) as e:
+            self.logger.log('Unable to read archive %s: %s' % (path, e), level='error')
+            sys.exit(1)
+
+        if archive.header.get('format') != format_version:
+            self.logger.log('Unable to read archive %s: format %s, expected %s' % (path, archive.header.get('format'), format_version), level='error')
+            sys.exit(1)
 
-            self.room_list.append(rooms[barrier_col][barrier_row])
-            self.room_index += 1
+        return archive
 
-            map = self.depth_first_map(rooms, self.vars['depth'], barrier_col, barrier_row)
-        else:
-            map = self.depth_first_map(rooms, self.vars['depth'], plunge_col, plunge_row)
+    # records point into the config by walk order, so they only decode against the config they were written with
+    def archive_decoder(self, archive, path):
+        from .archive import ConfigIndex, Decoder
 
-        self.print_map(map, exit_distance)
+        if archive.header['config_hash'] != self.config_hash:
+            self.logger.log('Unable to read archive %s: it was written with a different config (%s)' % (path, archive.header['config_hash']), level='error')
+            sys.exit(1)
+
+        return Decoder(ConfigIndex(self))
+
+    def archive_get(self, path, args):
+        if not args or not self.seeded:
+            self.logger.log('Invalid archive command: get needs a depth and a seed', level='error')
+            sys.exit(1)
 
-    def depth_first_map(self, rooms, depth, x, y):
-        if rooms[x][y]['distance'] >= self.config['options']['map_max_distance']:
+        depth = args[0]
+        seed = self.args['seed']
+
+        with self.open_archive(path) as archive:
+            decoder = self.archive_decoder(archive, path)
+            record = archive.find(depth, seed, decoder)
+            if record is None:
+                self.logger.log('No map for %s %s in %s' % (depth, seed, path), level='error')
+                sys.exit(1)
+
+            self.print_archived_map(decoder.decode(record))
+
+    def archive_dump(self, path, args):
+        with self.open_archive(path) as archive:
+            decoder = self.archive_decoder(archive, path)
+            for n, record in enumerate(archive):
+                self.print_archived_map(decoder.decode(record))
+                if n % 100 == 99:
+                    sys.stdout.flush()
+        sys.stdout.flush()
+
+    def archive_info(self, path, args):
+        with self.open_archive(path) as archive:
+            size = os.path.getsize(path)
+            self.logger.log('Archive: %s' % path)
+            self.logger.log('Format: %s' % archive.header['format'])
+            self.logger.log('Config hash: %s%s' % (archive.header['config_hash'], '' if archive.header['config_hash'] == self.config_hash else ' (not the loaded config)'))
+            self.logger.log('Rng: %s, spread: %s' % (archive.header['rng'], archive.header['spread']))
+            self.logger.log('Maps: %s, %s bytes, %.0f bytes/map' % (archive.count, size, size / archive.count if archive.count else 0))
+
+    def print_archived_map(self, map):
+        if self.args.get('format') in ['json', 'jsonl']:
+            import json
+
+            sys.stdout.write(json.dumps(self.export_map(map), default=json_default) + '\n')
             return
 
-        direction_list = ['W', 'N', 'E', 'S']
+        self.logger.log('Seed: %s' % map.seed)
+        self.print_map(map)
 
-        # directions = direction_list.copy()
-        # this isn't deterministic, and we need a deterministic order for seeding
-        # directions = list(set(directions) - set(rooms[x][y]['halls']))
+    # rolls many records of a table tree, one column per leaf table, streamed out as they are rolled
+    def command_generate(self, args):
+        from .batch import Batch, generate_rows
+        from .generate import TableSchema
 
-        directions = []
-        for d in direction_list:
-            if d not in rooms[x][y]['halls']:
-                directions.append(d)
+        if not args:
+            self.logger.log('Invalid generate command: needs a table path, like character', level='error')
+            sys.exit(1)
 
-        self.random.shuffle(directions)
-        if self.args['rolls_on']:
-            self.logger.log('direction roll -> %s' % directions)
+        path = args[0]
+        try:
+            schema = TableSchema(self, path)
+        except (KeyError, IndexError, TypeError):
+            self.logger.log('Invalid table path: %s' % path, level='error')
+            sys.exit(1)
+        except ValueError as e:
+            self.logger.log('Invalid table path: %s' % e, level='error')
+            sys.exit(1)
+
+        format = self.args.get('format') or 'jsonl'
+        if format == 'json':
+            format = 'jsonl'
+        if format not in ['jsonl', 'csv']:
+            self.logger.log('Invalid format for the generate command: %s, must be one of %s' % (format, ['jsonl', 'csv']), level='error')
+            sys.exit(1)
+
+        count = self.args['count'] or 1
+        workers = self.args['workers']
+        if workers is None and count < GENERATE_POOL_MIN:
+            workers = 1
+
+        batch = Batch(self, workers=workers)
+        jobs = ((path, seeds, self.args['spread']) for seeds in batch.seed_chunks(count, 256))
+
+        columns = ['seed'] + schema.columns
+        if format == 'csv':
+            import csv
+
+            writer = csv.writer(sys.stdout, lineterminator='\n')
+            writer.writerow(columns)
+            write = writer.writerows
+        else:
+            import json
+
+            def write(rows):
+                sys.stdout.write(''.join([json.dumps(dict(zip(columns, row))) + '\n' for row in rows]))
+
+        for rows in batch.map(generate_rows, jobs):
+            write(rows)
+            sys.stdout.flush()
+
+    def command_shell(self, args):
+        from .shell import Shell
+
+        try:
+            Shell(self).cmdloop()
+        except KeyboardInterrupt:
+            print()
+
+    def validate_depth(self, depth):
+        depths = [d['name'] for d in self.config['depths']]
+        if depth not in depths:
+            self.logger.log('Invalid depth: %s, must be one of %s' % (depth, depths), level='error')
+            sys.exit(1)
+
+    def command_serve(self, args):
+        from .server import Server
+
+        server = Server(self, host=self.args['host'], port=self.args['port'], cache=self.new_map_cache(), reload_interval=self.args.get('reload_interval') or 0)
+        self.logger.log('Serving on http://%s:%s' % server.address)
+        server.serve_forever()
+
+    # lazy maps roll only the layout up front, room contents are rolled when first read
+    # constrained maps reroll rooms in place, so the same seed and constraints always give the same map
+    def generate_map(self, ctx, depth, lazy=False, constraints=None):
+        self.start_map(ctx, depth)
+        # v1 rooms have to be rolled in walk order, and danger constraints read every room as it's rolled
+        ctx.lazy = lazy and ctx.rng != 'v1' and (constraints is None or constraints.max_danger is None)
+
+        exit_distance = self.roll_die(ctx, die=10, advantage=2)
+        map = Map(depth, ctx.seed, self.config['options']['map_size'], exit=exit_distance)
+
+        for x, y, room in self.fixed_rooms(depth, exit_distance):
+            # each fixed room opens onto the one above it
+            if map.rooms:
+                map.connect(x, y, 'N')
+            map.add(room, x, y)
+        ctx.room_index = len(map.rooms) - 1
+
+        # the walk starts from the last fixed room
+        self.depth_first_map(ctx, map, depth, x, y, constraints=constraints)
+
+        if constraints is not None:
+            self.backtrack_map(ctx, map, depth, constraints)
+
+        return map
+
+    # rerolls dead end rooms into rooms with more hallways and walks on from them, until the constraints are met
+    def backtrack_map(self, ctx, map, depth, constraints):
+        attempts = {}
+
+        while constraints.unmet(map) and map.retries < constraints.max_retries:
+            room = self.dead_end(map, constraints, attempts)
+            if room is None:
+                break
+
+            self.reroll_room(ctx, map, depth, room, attempts)
+            if room.hallways > 0:
+                self.depth_first_map(ctx, map, depth, room.x, room.y, constraints=constraints)
+
+    # the farthest, then newest, rolled room with one hallway that still has space to grow
+    def dead_end(self, map, constraints, attempts):
+        max_distance = self.config['options']['map_max_distance']
+
+        best = None
+        for room in map.rooms:
+            # fixed rooms have no situation
+            if room.situation is None or room.hallways > 0 or room.distance >= max_distance:
+                continue
+            if attempts.get(room.index, 0) >= constraints.room_retries:
+                continue
+            if len(map.hall_list(room.x, room.y)) != 1 or not map.open_neighbors(room.x, room.y):
+                continue
+            if best is None or room.distance >= best.distance:
+                best = room
+
+        return best
+
+    # rolls a room again in place, keeping its index, position and the hallways it already has
+    def reroll_room(self, ctx, map, depth, room, attempts):
+        map.retries += 1
+        attempts[room.index] = attempts.get(room.index, 0) + 1
+
+        rolled = self.roll_room(ctx, depth, index=room.index, attempt=attempts[room.index])
+        self.logger.log('rerolled room: %s -> %s', room, rolled, level='debug')
+
+        room.location = rolled.location
+        room.situation = rolled.situation
+        room.hallways = rolled.hallways - len(map.hall_list(room.x, room.y))
+
+    # rolls one room's contents without the map, v2 only since v1 rooms depend on the rooms before them
+    def generate_room(self, ctx, depth, index):
+        self.start_map(ctx, depth)
+        exit_distance = self.roll_die(ctx, die=10, advantage=2)
+
+        fixed_rooms = self.fixed_rooms(depth, exit_distance)
+        if index < len(fixed_rooms):
+            return fixed_rooms[index][2]
+
+        location, hallways = self.roll_location(ctx, depth, index)
+        return Room(index, location, situation=self.roll_situation(ctx, depth, index), hallways=hallways)
+
+    # number of rooms in a v2 map, from its lazy layout, which leaves room contents unrolled
+    def room_count(self, ctx, depth):
+        # generating sets up the context's layout stream and variables, so it gets a copy
+        return len(self.generate_map(ctx.derive(depth, 'room_count'), depth, lazy=True).rooms)
+
+    # sets the depth variables and, for v2, switches the layout to its own stream
+    def start_map(self, ctx, depth):
+        ctx.vars['depth'] = depth
+        ctx.vars['depth_value'] = [d['name'] for d in self.config['depths']].index(ctx.vars['depth']) + 1
+
+        if ctx.rng != 'v1':
+            ctx.random = ctx.stream(depth, 'layout')
+
+    # the rooms every map of a depth starts with, as (x, y, room), each one below the last
+    def fixed_rooms(self, depth, exit_distance):
+        plunge_row = self.config['options']['map_plunge_row']
+        plunge_col = self.config['options']['map_plunge_col']
+
+        plunge = Room(0, self.config['table']['environment'][depth]['plunge'], hallways=3, exit=exit_distance)
+
+        if depth != 'reef':
+            return [(plunge_col, plunge_row, plunge)]
+
+        plunge.hallways = 0
+
+        barrier = self.config['table']['environment']['reef']['great_barrier']
+        return [
+            (plunge_col, plunge_row, plunge),
+            # distance technically should be 1, but reef maps are a little tight
+            (plunge_col, plunge_row + 1, Room(1, barrier, hallways=barrier['hallways'] - 1)),
+        ]
+
+    def export_map(self, map):
+        rooms = []
+        for room in map.rooms:
+            room = map.export_room(room)
+            for part in ['location', 'situation']:
+                if isinstance(room.get(part), LazyRoll):
+                    room[part] = room[part].resolve()
+            rooms.append(room)
+
+        return {
+            'depth': map.depth,
+            'seed': map.seed,
+            'exit': map.exit,
+            'map_size': map.size,
+            'rooms': rooms,
+        }
+
+    # only the topology of a map, which leaves the contents of a lazy map unrolled
+    def export_layout(self, map):
+        rooms = []
+        for room in map.rooms:
+            rooms.append({
+                'index': room.index,
+                'x': room.x,
+                'y': room.y,
+                'halls': map.hall_list(room.x, room.y),
+                'distance': room.distance,
+            })
+
+        return {
+            'depth': map.depth,
+            'seed': map.seed,
+            'exit': map.exit,
+            'map_size': map.size,
+            'rooms': rooms,
+        }
+
+    # walks the map with an explicit stack, visiting rooms in the same order as a recursive depth first search
+    def depth_first_map(self, ctx, map, depth, x, y, constraints=None):
+        stack = []
+        self.enter_room(ctx, map, stack, map.at(x, y))
+
+        while stack:
+            room, directions = stack[-1]
+
+            if room.hallways <= 0 or len(directions) == 0:
+                stack.pop()
+                continue
 
-        while rooms[x][y]['hallways'] > 0 and len(directions) > 0:
             direction = directions.pop(0)
-            opposite_direction = direction_list[(direction_list.index(direction) + 2) % len(direction_list)]
-
-            if direction == 'W' and x - 1 >= 0:
-                next_x = x - 1
-                next_y = y
-            elif direction == 'N' and y - 1 >= 0:
-                next_x = x
-                next_y = y - 1
-            elif direction == 'E' and x + 1 < len(rooms):
-                next_x = x + 1
-                next_y = y
-            elif direction == 'S' and y + 1 < len(rooms[0]):
-                next_x = x
-                next_y = y + 1
-            else:
-                self.logger.log('map out of bounds: %s, %s' % (x, y), level='debug')
+
+            cell = map.neighbor(room.x, room.y, direction)
+            if cell is None:
+                self.logger.log('map out of bounds: %s, %s', room.x, room.y, level='debug')
                 continue
 
-            if rooms[next_x][next_y]:
-                if rooms[next_x][next_y]['hallways'] <= 0:
-                    self.logger.log('room exists and has no hallways...' % rooms[next_x][next_y], level='debug')
+            next_room = map.at(*cell)
+            if next_room is not None:
+                if next_room.hallways <= 0:
+                    self.logger.log('room exists and has no hallways...', level='debug')
                     continue
-                else:
-                    self.logger.log('room exists, connecting...' % rooms[next_x][next_y], level='debug')
-                    rooms[x][y]['halls'].append(direction)
-                    rooms[next_x][next_y]['halls'].append(opposite_direction)
-                    rooms[x][y]['hallways'] -= 1
-                    rooms[next_x][next_y]['hallways'] -= 1
+
+                self.logger.log('room exists, connecting...', level='debug')
+                map.connect(room.x, room.y, direction)
+                room.hallways -= 1
+                next_room.hallways -= 1
             else:
-                room = self.roll_room(depth)
-                room['distance'] = rooms[x][y]['distance'] + 1
-                rooms[next_x][next_y] = room
-
-                self.logger.log('next room: %s' % rooms[next_x][next_y], level='debug')
-                rooms[x][y]['halls'].append(direction)
-                rooms[next_x][next_y]['halls'].append(opposite_direction)
-                rooms[x][y]['hallways'] -= 1
-                rooms[next_x][next_y]['hallways'] -= 1
-
-                self.depth_first_map(rooms, depth, next_x, next_y)
-
-        return rooms
-
-    def roll_room(self, depth):
-        self.room_index += 1
-
-        location = self.roll_table(self.config['table']['environment'][depth]['location'])[0].copy()
-        self.parse_rolls(location, rand=self.roll_seed(self.random))
-        situation = self.roll_table(self.config['table']['situation'])[0].copy()
-        self.parse_rolls(situation, rand=self.roll_seed(self.random))
-
-        room = {
-            'location': location,
-            'situation': situation,
-            'index': self.room_index,
-            'hallways': location['hallways'],
-            'halls': [],
-        }
+                if constraints is not None and constraints.full(map):
+                    self.logger.log('map has max rooms...', level='debug')
+                    continue
 
-        if isinstance(room['hallways'], str):
-            room['hallways'] = self.parse_str_roll(room['hallways'])
+                next_room = self.roll_room(ctx, depth)
+                if constraints is not None:
+                    next_room = self.fit_room(ctx, map, depth, next_room, constraints)
+                next_room.distance = room.distance + 1
+                map.add(next_room, *cell)
 
-        self.room_list.append(room)
-        return room
+                self.logger.log('next room: %s', next_room, level='debug')
+                map.connect(room.x, room.y, direction)
+                room.hallways -= 1
+                next_room.hallways -= 1
 
-    def command_roll(self, args):
-        table = self.dig(self.config['table'], args[0])
-        self.roll(label=args[0], table=table)
+                self.enter_room(ctx, map, stack, next_room)
 
-    def parse_rolls(self, data, rand, root=None):
-        if not isinstance(data, dict) or 'roll' not in data:
+        return map
+
+    # pushes a room onto the walk with its unexplored directions shuffled, unless it's at the max distance
+    def enter_room(self, ctx, map, stack, room):
+        if room.distance >= self.config['options']['map_max_distance']:
             return
 
-        if root == None:
-            root = data
+        # directions are always listed in the same order before the shuffle, so the walk stays seeded
+        halls = map.hall_mask(room.x, room.y)
+        directions = [d for d in DIRECTIONS if not halls & HALL_BITS[d]]
+
+        ctx.random.shuffle(directions)
+        if ctx.rolls_on:
+            self.logger.log('direction roll -> %s' % directions)
+
+        stack.append((room, directions))
+
+    # rerolls the room until it fits the danger budget, each reroll counts against the map's retries
+    def fit_room(self, ctx, map, depth, room, constraints):
+        attempt = 0
+        while not constraints.fits(map, room) and map.retries < constraints.max_retries and attempt < constraints.room_retries:
+            map.retries += 1
+            attempt += 1
+            room = self.roll_room(ctx, depth, index=room.index, attempt=attempt)
+            self.logger.log('rerolled room over the danger budget: %s', room, level='debug')
+
+        return room
+
+    # rerolls pass the room's index and attempt number, v2 rolls each attempt from its own streams
+    def roll_room(self, ctx, depth, index=None, attempt=0):
+        if index is None:
+            ctx.room_index += 1
+            index = ctx.room_index
+
+        if ctx.rng == 'v1':
+            location = self.roll_table(ctx, self.config['table']['environment'][depth]['location'])[0]
+            self.parse_rolls(ctx, location, rand=self.roll_seed(ctx, ctx.random))
+            situation = self.roll_table(ctx, self.config['table']['situation'])[0]
+            self.parse_rolls(ctx, situation, rand=self.roll_seed(ctx, ctx.random))
+
+            hallways = location['hallways']
+            if isinstance(hallways, str):
+                hallways = self.parse_str_roll(ctx, hallways)
+        else:
+            location, hallways = self.roll_location(ctx, depth, index, lazy=ctx.lazy, attempt=attempt)
+            if ctx.lazy:
+                situation = LazyRoll(self.roll_situation, ctx, depth, index, attempt)
+            else:
+                situation = self.roll_situation(ctx, depth, index, attempt=attempt)
+
+        return Room(index, location, situation=situation, hallways=hallways)
+
+    # v2 rooms roll each part from its own stream, so any room can be rolled without the rooms before it
+    # the layout needs the location's hallways, so only the location's own rolls can be left for later
+    def roll_location(self, ctx, depth, index, lazy=False, attempt=0):
+        location_ctx = ctx.derive(*self.room_key(depth, index, 'location', attempt))
+        location = self.roll_table(location_ctx, self.config['table']['environment'][depth]['location'])[0]
+
+        hallways = location['hallways']
+        if isinstance(hallways, str):
+            hallways = self.parse_str_roll(location_ctx, hallways)
+
+        if lazy:
+            return LazyRoll(self.roll_location_results, ctx, depth, index, location, attempt), hallways
+
+        return self.roll_location_results(ctx, depth, index, location, attempt), hallways
+
+    def roll_location_results(self, ctx, depth, index, location, attempt=0):
+        rolls_ctx = ctx.derive(*self.room_key(depth, index, 'location_rolls', attempt))
+        self.parse_rolls(rolls_ctx, location, rand=rolls_ctx.random)
+
+        return location
+
+    def roll_situation(self, ctx, depth, index, attempt=0):
+        situation_ctx = ctx.derive(*self.room_key(depth, index, 'situation', attempt))
+        situation = self.roll_table(situation_ctx, self.config['table']['situation'])[0]
+        self.parse_rolls(situation_ctx, situation, rand=situation_ctx.random)
+
+        return situation
+
+    # the stream key for part of a v2 room, the first attempt keeps the key unconstrained maps use
+    def room_key(self, depth, index, part, attempt=0):
+        if attempt:
+            return depth, index, part, attempt
+        return depth, index, part
+
+    def command_roll(self, args):
+        if not args:
+            self.logger.log('Invalid roll command: needs a table path', level='error')
+            sys.exit(1)
 
-        self.logger.log('parsing rolls...' % data, level='debug')
-        self.logger.log(json.dumps(data, indent=2, default=str), level='debug')
+        if self.args['count'] is not None and self.args['count'] < 1:
+            self.logger.log('Invalid roll count: %s, must be at least 1' % self.args['count'], level='error')
+            sys.exit(1)
+
+        self.logger.log('Seed: %s' % self.args['seed'])
+        ctx = self.context()
+        table = self.dig(ctx, self.config['table'], args[0])
+        if not rollable(table):
+            self.logger.log('Invalid table path: %s is not a table' % args[0], level='error')
+            sys.exit(1)
 
-        if not isinstance(data['roll'], list):
-            data['roll'] = [data['roll']]
+        if self.args['count']:
+            self.roll_histogram(ctx, label=args[0], table=table, count=self.args['count'])
+        else:
+            self.roll(ctx, label=args[0], table=table)
 
-        for roll in data['roll']:
-            if not isinstance(roll, dict):
-                roll = {'table': roll}
+    def parse_rolls(self, ctx, data, rand, root=None):
+        if not isinstance(data, Mapping) or 'roll' not in data:
+            return
 
-            if 'count' not in roll:
-                roll['count'] = 1
-            roll['count'] = self.interpolate_value(roll['count'])
+        if root == None:
+            root = data
 
-            if 'advantage' not in roll:
-                roll['advantage'] = 0
+        debug = self.logger.is_enabled('debug')
+        if debug:
+            self.logger.log('parsing rolls...', level='debug')
+            self.logger.log(lambda: self.dump(data), level='debug')
 
-            results = []
+        for spec in self.roll_specs(data['roll']):
+            count = self.interpolate_value(ctx, spec.count)
 
-            if 'result' in roll:
-                if not isinstance(roll['result'], list):
-                    roll['result'] = [roll['result']]
-                results.extend(roll['result'])
+            results = [RollResult(r) if isinstance(r, dict) else r for r in spec.results]
 
-            self.logger.log(str(results), level='debug')
+            if debug:
+                self.logger.log('%s', results, level='debug')
 
-            if 'table' in roll:
-                if not isinstance(roll['table'], list):
-                    roll['table'] = [roll['table']]
-                table = [self.dig(self.config['table'], t) for t in roll['table']]
+            if spec.tables is not MISSING:
+                table = [self.resolve_table(ctx, path) for path in spec.tables]
 
-                for c in range(roll['count']):
-                    results.extend([self.roll_table(table=t, advantage=roll['advantage']) for t in table])
+                for c in range(count):
+                    results.extend([self.roll_table(ctx, table=t, advantage=spec.advantage) for t in table])
 
-            elif 'args' in roll:
-                roll_results = [self.roll_die(**roll['args'])]
+            elif spec.args is not MISSING:
+                roll_results = [self.roll_die(ctx, **spec.args)]
 
                 for r in results:
                     if '%s' in r['name']:
-                        r['name'] = r['name'] % roll_results[0]
+                        r['name'] = self.fill_name(ctx, r, roll_results[0])
 
                 results.append(roll_results)
 
@@ -307,13 +969,14 @@ class AROS():
                 else:
                     flat_results.append(r)
 
-            self.logger.log('extended results', level='debug')
-            self.logger.log(str(flat_results), level='debug')
+            if debug:
+                self.logger.log('extended results', level='debug')
+                self.logger.log('%s', flat_results, level='debug')
 
             for r in flat_results:
-                if isinstance(r, dict):
-                    if 'format' in roll:
-                        r['format'] = roll['format']
+                if isinstance(r, Mapping):
+                    if spec.format is not MISSING:
+                        r['format'] = spec.format
                     if 'type' in r:
                         if r['type'] not in root:
                             root[r['type']] = []
@@ -325,13 +988,101 @@ class AROS():
             root['results'].extend(flat_results)
 
             for r in flat_results:
-                if isinstance(r, dict) and 'roll' in r:
-                    self.parse_rolls(r, rand, root)
+                if isinstance(r, Mapping) and 'roll' in r:
+                    self.parse_rolls(ctx, r, rand, root)
+
+
+    # v1 used to fill '%s' names into the config itself, so the first value stuck for every later roll of the entry
+    # v1 keeps that for the rest of the generation, without writing to the shared config, and v2 fills every roll
+    def fill_name(self, ctx, result, value):
+        if ctx.rng != 'v1':
+            return result['name'] % value
+
+        name = ctx.filled_names.get(id(result.entry))
+        if name is None:
+            name = result['name'] % value
+            ctx.filled_names[id(result.entry)] = name
+
+        return name
+
+    # roll specs are compiled once, keyed by the config object they came from
+    def roll_specs(self, rolls):
+        specs = self.compiled_rolls.get(id(rolls))
+        if specs is None:
+            specs = compile_rolls(rolls, self.config['table'])
+            self.compiled_rolls[id(rolls)] = specs
+
+        return specs
+
+    def resolve_table(self, ctx, path):
+        return path.resolve(self.config['table'], ctx.vars)
 
+    def roll(self, ctx, label='', table=None):
+        for label, text, result in self.roll_results(ctx, label, table):
+            self.logger.log(text)
+
+    def command_odds(self, args):
+        import re
+        from .odds import dice_distribution
+
+        if not args:
+            self.logger.log('Invalid odds command: needs a table path or a die like 2d6, d20++ or d20-', level='error')
+            sys.exit(1)
+
+        # dice use the same notation as rolled values, e.g. 1d20++ is a d20 with advantage 2
+        match = re.match(r'^(\d*)d(\d+)(\+*|-*)$', args[0])
+        if match:
+            count = int(match.group(1) or 1)
+            die = int(match.group(2))
+            advantage = len(match.group(3)) if match.group(3).startswith('+') else -len(match.group(3))
+            if self.args['advantage'] is not None:
+                advantage = self.args['advantage']
+
+            self.validate_die(die)
+            self.logger.log('%sd%s, advantage %s' % (count, die, max(-3, min(advantage, 3))))
+            self.logger.log('    {0:>5} {1:>10} {2:>10}'.format('total', 'chance', 'at least'))
+
+            distribution = dice_distribution(die, count=count, advantage=advantage)
+            at_least = 1
+            for total, p in distribution:
+                self.logger.log('    {0:>5} {1:>9.4%} {2:>9.4%}'.format(total, float(p), float(at_least)))
+                at_least -= p
+        else:
+            ctx = self.context()
+            table = self.dig(ctx, self.config['table'], args[0])
+            self.table_odds(label=args[0], table=table, spread=ctx.spread)
+
+    def table_odds(self, label='', table=None, spread=0):
+        from .odds import TableOdds
+
+        if isinstance(table, list) or 'entries' in table:
+            odds = TableOdds(self, table, advantage=self.args['advantage'])
+            self.logger.log('%s: d%s, advantage %s, spread %s' % (label, odds.die, odds.advantage, spread))
+            for entry, low, high, p in odds.entries(spread):
+                name = entry['name'] if isinstance(entry, dict) else entry
+                dice = str(low + 1) if high == low + 1 else '%s-%s' % (low + 1, high)
+                self.logger.log('    {0:>7} {1:>9.4%}  {2}'.format(dice, float(p), name))
+        else:
+            for key, value in table.items():
+                self.table_odds('%s.%s' % (label, key), value, spread)
+
+    # rolls each table under the given one count times, logging counts instead of results
+    def roll_histogram(self, ctx, label='', table=None, count=1):
+        from .histogram import TableHistogram
+
+        if isinstance(table, list) or 'entries' in table:
+            histogram = TableHistogram(self, table)
+            counts = histogram.roll(ctx, count, spread=ctx.spread)
+            for line in histogram.lines(label, counts, spread=ctx.spread):
+                self.logger.log(line)
+        else:
+            for key, value in table.items():
+                self.roll_histogram(ctx, '%s.%s' % (label, key), value, count)
 
-    def roll(self, label='', table=None):
+    # yields (label, formatted text, rolled entries) for each table under the given one
+    def roll_results(self, ctx, label='', table=None):
         if isinstance(table, list) or 'entries' in table:
-            result = self.roll_table(table=table, spread=self.args['spread'])
+            result = self.roll_table(ctx, table=table, spread=ctx.spread)
             if not isinstance(result, list):
                 result = [result]
 
@@ -341,36 +1092,29 @@ class AROS():
                 format = label + ': %s'
 
             results = ', '.join([r['name'] for r in result])
-            self.logger.log(format % results)
+            yield label, format % results, result
         else:
             for key, value in table.items():
-                self.roll('%s.%s' % (label, key), value)
+                yield from self.roll_results(ctx, '%s.%s' % (label, key), value)
 
-    def roll_table(self, table=[], spread=0, advantage=None):
+    def roll_table(self, ctx, table=[], spread=0, advantage=None):
         adv = 0
 
         if isinstance(table, list):
-            table = {'entries': table}
-
-        entries = table['entries'].copy()
+            entries = table
+            table = {}
+        else:
+            entries = table['entries']
 
         if 'advantage' in table:
             adv = table['advantage']
         if advantage != None:
             adv = advantage
 
-        if isinstance(entries[0], dict):
-            expanded_table = []
-            for entry in entries:
-                if 'frequency' in entry:
-                    for n in range(0, entry['frequency']):
-                        expanded_table.append(entry)
-                else:
-                    expanded_table.append(entry)
-            entries = expanded_table
+        weighted = self.weighted_table(entries)
 
-        die = len(entries)
-        roll = self.roll_die(die, advantage=adv)
+        die = weighted.die
+        roll = self.roll_die(ctx, die, advantage=adv)
         roll -= 1
         rolls = [roll]
 
@@ -379,62 +1123,43 @@ class AROS():
             rolls.append((roll + n) % die)
 
         results = []
+        # results share the config's entries rather than copying them
+        table = table or None
         for r in rolls:
-            if not isinstance(entries[r], dict):
-                result = {'name': entries[r]}
-            else:
-                result = entries[r].copy()
+            results.append(RollResult(weighted.record(r), r + 1, table))
 
-            result['die'] = r + 1
+        return results
 
-            keys = [
-                'advantage',
-                'count',
-                'format',
-                'roll',
-                'type',
-            ]
-            for k in keys:
-                if k in table and k not in result:
-                    result[k] = table[k]
+    def weighted_table(self, entries):
+        weighted = self.weighted_tables.get(id(entries))
+        if weighted is None:
+            weighted = WeightedTable(entries)
+            self.weighted_tables[id(entries)] = weighted
 
-            results.append(result)
+        return weighted
 
-        return results
+    def new_seed(self, rand):
+        return ''.join(rand.choice(SEED_CHARS) for x in range(16))
 
-    def roll_seed(self, rand):
-        seed = ''.join(rand.choice('0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz') for x in range(16))
+    def roll_seed(self, ctx, rand):
+        seed = self.new_seed(rand)
         new_rand = random.Random(seed)
 
-        if self.args['rolls_on']:
+        if ctx.rolls_on:
             self.logger.log('seed roll -> %s' % seed)
 
         return new_rand
 
     # returns 1..N
-    def roll_die(self, die, count=1, advantage=0, label=''):
+    def roll_die(self, ctx, die, count=1, advantage=0, label=''):
         advantage = max(-3, min(advantage, 3))
-        count = self.interpolate_value(count)
-
-        valid_dice = [
-            2,
-            3,
-            4,
-            6,
-            8,
-            10,
-            12,
-            20,
-            100,
-        ]
+        count = self.interpolate_value(ctx, count)
 
-        if die not in valid_dice:
-            self.logger.log('Invalid roll: must be a valid die roll! Die has %s sides!' % die, level='error')
-            sys.exit(1)
+        self.validate_die(die)
 
         adv_count = count + abs(advantage)
 
-        roll = [self.random.randint(1, die) for c in range(adv_count)]
+        roll = [ctx.random.randint(1, die) for c in range(adv_count)]
         final_roll = sorted(roll.copy())
 
         for n in range(abs(advantage)):
@@ -444,7 +1169,7 @@ class AROS():
                 del final_roll[-1]
         roll_sum = sum(final_roll)
 
-        if self.args['rolls_on']:
+        if ctx.rolls_on:
             adv = ''
             if advantage > 0:
                 adv = '+' * advantage
@@ -459,194 +1184,124 @@ class AROS():
 
         return roll_sum
 
-    def dig(self, data, path):
+    def validate_die(self, die):
+        if die not in self.valid_dice:
+            self.logger.log('Invalid roll: must be a valid die roll! Die has %s sides!' % die, level='error')
+            sys.exit(1)
+
+    def dig(self, ctx, data, path):
         keys = path.split('.')
         while keys:
             if keys[0].isdigit():
                 keys[0] = int(keys[0])
 
             if keys[0]:
-                keys[0] = self.interpolate_value(keys[0])
+                keys[0] = self.interpolate_value(ctx, keys[0])
                 data = data[keys[0]]
 
             keys.pop(0)
 
         return data
 
-    def interpolate_value(self, value):
+    def interpolate_value(self, ctx, value):
         if isinstance(value, str) and value.startswith('$'):
-            return self.vars[value[1:]]
+            return ctx.vars[value[1:]]
         else:
             return value
 
-    def print_map(self, rooms, exit_distance):
-        self.logger.log()
-
-        for y in range(len(rooms[0])):
-            x_rooms = []
-            for x in range(len(rooms)):
-                x_rooms.append(rooms[x][y])
-
-            room_lines = [self.print_room_to_lines(r) for r in x_rooms]
-
-            for l in range(self.config['options']['map_print_room_rows']):
-                print(''.join([rl[l] for rl in room_lines]))
-
-        self.logger.log()
-        self.logger.log('Exit Distance: %s' % self.color(str(exit_distance), BC.BOLD))
+    # file is for rendering to text, by default the map goes to stdout and its headings through the logger
+    def print_map(self, map, file=None):
+        map_size = map.size
+        out = file or sys.stdout
+        log = self.logger.log if file is None else lambda message='': print(message, file=file)
+        log()
+
+        # every empty cell renders the same, so it's drawn once and only occupied cells are rendered
+        empty_lines = self.print_room_to_lines(None)
+        occupied_rows = {}
+        for room in map.rooms:
+            occupied_rows.setdefault(room.y, []).append(room)
+
+        empty_row = None
+        for y in range(map_size):
+            if y not in occupied_rows:
+                if empty_row is None:
+                    empty_row = ''.join([line * map_size + '\n' for line in empty_lines])
+                out.write(empty_row)
+                continue
 
-        for r in self.room_list:
-            self.print_room_description(r)
+            room_lines = [empty_lines] * map_size
+            for room in occupied_rows[y]:
+                room_lines[room.x] = self.print_room_to_lines(room, map.hall_mask(room.x, room.y))
 
-    def print_room_to_lines(self, room):
-        height = self.config['options']['map_print_room_rows']
-        width = self.config['options']['map_print_room_cols']
-        half_height = int(height / 2)
-        half_width = int(width / 2)
-        if 'map_print_fill' in self.config['options']:
-            fill = self.config['options']['map_print_fill']
-        else:
-            fill = '░'
-        if not isinstance(fill, list):
-            fill = [fill]
+            out.write(''.join([''.join(row) + '\n' for row in zip(*room_lines)]))
 
-        # fill = [self.color(f, BC.BLUE) for f in fill]
+        log()
+        log('Exit Distance: %s' % self.color(str(map.exit), BC.BOLD))
 
-        
+        for r in map.rooms:
+            self.print_room_description(r, file=file)
 
-        lines = []
-        for l in range(height):
-            # lines.append(' ' * width)
-            lines.append(self.color(fill[0] * width, 'blue'))
+    def render_map(self, map):
+        import io
 
-        if room:
-            if 'danger' in room['location']:
-                color = room['location']['danger'] + 3
-            else:
-                color = 0
-
-            lines[0] = '%s%s%s' % (' ' * half_width, self.color('║', self.color_order[color]) if 'N' in room['halls'] else ' ', ' ' * half_width)
-            room_top = '╔%s%s%s╗' % ('═' * (half_width - 2), '╩' if 'N' in room['halls'] else '═', '═' * (half_width - 2))
-            lines[1] = ' %s ' % self.color(room_top, self.color_order[color])
-
-            room_bottom = '╚%s%s%s╝' % ('═' * (half_width - 2), '╦' if 'S' in room['halls'] else '═', '═' * (half_width - 2))
-
-            lines[height - 2] = ' %s ' % self.color(room_bottom, self.color_order[color])
-            lines[height - 1] = '%s%s%s' % (' ' * half_width, self.color('║', self.color_order[color]) if 'S' in room['halls'] else ' ', ' ' * half_width)
-
-            text_lines = []
-            line_format = '{0:<%s.%s}' % (width - 4, width - 4)
-            index_format = '{0:>2.2}'
-            title_format = '{0:<%s.%s}' % (width - 7, width - 7)
-            index = self.color(index_format.format(str(room['index'])), 'bold')
-            title = self.color(title_format.format(room['location']['name']), 'underline')
-            text_lines.append(index + ' ' + title)
-            if 'situation' in room:
-                text_lines.append(self.color(line_format.format('%s' % room['situation']['name']), 'blue'))
-            if 'exit' in room:
-                text_lines.append(line_format.format('Exit: %s' % room['exit']))
-
-            misc_lines = height - 6
-
-            if 'trap' in room['location']:
-                if misc_lines > 0:
-                    trap_line = ', '.join([t['name'] for t in room['location']['trap']])
-                    c = self.config['options']['descriptions']['colors']['trap']
-                    text_lines.append(self.color(line_format.format(trap_line), c))
-                    misc_lines -= 1
-
-            if 'creature' in room['location']:
-                creatures = list(self.chunks(room['location']['creature'], self.config['options']['map_print_creatures_per_line']))
-                i = 0
-                while misc_lines > 0 and i < len(creatures):
-                    creature_line = ', '.join([c['name'] for c in creatures[i]])
-                    c = self.config['options']['descriptions']['colors']['creature']
-                    text_lines.append(self.color(line_format.format(creature_line), c))
-                    i += 1
-                    misc_lines -= 1
-
-            for n in range(2, height - 2):
-                lines[n] = ''
-                if n == half_height and 'W' in room['halls']:
-                    lines[n] += self.color('═╣', self.color_order[color])
-                else:
-                    lines[n] += ' %s' % self.color('║', self.color_order[color])
-
-                if n - 2 < len(text_lines):
-                    lines[n] += text_lines[n - 2]
-                else:
-                    lines[n] += ' ' * (width - 4)
+        out = io.StringIO()
+        self.print_map(map, file=out)
+        return out.getvalue()
 
-                if n == half_height and 'E' in room['halls']:
-                    lines[n] += self.color('╠═', self.color_order[color])
-                else:
-                    lines[n] += '%s ' % self.color('║', self.color_order[color])
-
-        for l in range(len(lines)):
-            for i in range(len(lines[l])):
-                if lines[l][i] == ' ':
-                    f = (l + i) % len(fill)
-                    tmp = list(lines[l])
-                    tmp[i] = fill[f]
-                    lines[l] = ''.join(tmp)
-                elif lines[l][i] not in self.color_order:
-                    # print('(%s)' % lines[l][i])
-                    break
-            for i in reversed(range(len(lines[l]))):
-                if lines[l][i] == ' ':
-                    f = (l + i) % len(fill)
-                    tmp = list(lines[l])
-                    tmp[i] = fill[f]
-                    lines[l] = ''.join(tmp)
-                elif lines[l][i] not in self.color_order:
-                    # print('(%s)' % lines[l][i])
-                    break
+    # halls is the room's hall mask from the map
+    def print_room_to_lines(self, room, halls=0):
+        return self.renderer.tile(room, halls)
 
-        return lines
+    def print_room_description(self, room, file=None):
+        import textwrap
 
-    def print_room_description(self, room):
-        self.logger.log(json.dumps(room, indent=2, default=str), level='debug')
+        self.logger.log(lambda: self.dump(room.export()), level='debug')
 
+        location = room.location
         danger = ''
         location_color = 0
-        if 'danger' in room['location']:
-            location_color = room['location']['danger'] + 3
-            if room['location']['danger'] > 0:
-                danger = '+' * room['location']['danger']
-            elif room['location']['danger'] < 0:
-                danger = '-' * abs(room['location']['danger'])
-
-        print(self.color_order[location_color])
-        print('{0:>2}. {1} {2}'.format(room['index'], room['location']['name'], danger))
-        print('--------------------------------')
-        print(BC.RESET)
-        print(textwrap.indent('{0}'.format(room['location']['description']), self.indent))
-        print()
-        if 'results' in room['location']:
-            self.print_room_results(room['location']['results'])
-
-        if 'situation' in room:
-            print(BC.BLUE)
-            print(textwrap.indent('Situation: {0}'.format(room['situation']['name']), self.indent))
-            print(textwrap.indent('--------------------------------', self.indent))
-            print(BC.RESET)
-            print(textwrap.indent('{0}'.format(room['situation']['description']), self.indent))
-            print()
-            if 'results' in room['situation']:
-                self.print_room_results(room['situation']['results'])
+        if 'danger' in location:
+            location_color = location['danger'] + 3
+            if location['danger'] > 0:
+                danger = '+' * location['danger']
+            elif location['danger'] < 0:
+                danger = '-' * abs(location['danger'])
+
+        print(self.color_order[location_color], file=file)
+        print('{0:>2}. {1} {2}'.format(room.index, location['name'], danger), file=file)
+        print('--------------------------------', file=file)
+        print(BC.RESET, file=file)
+        print(textwrap.indent('{0}'.format(location['description']), self.indent), file=file)
+        print(file=file)
+        if 'results' in location:
+            self.print_room_results(location['results'], file=file)
+
+        situation = room.situation
+        if situation is not None:
+            print(BC.BLUE, file=file)
+            print(textwrap.indent('Situation: {0}'.format(situation['name']), self.indent), file=file)
+            print(textwrap.indent('--------------------------------', self.indent), file=file)
+            print(BC.RESET, file=file)
+            print(textwrap.indent('{0}'.format(situation['description']), self.indent), file=file)
+            print(file=file)
+            if 'results' in situation:
+                self.print_room_results(situation['results'], file=file)
+
+    def print_room_results(self, results, file=None):
+        import textwrap
 
-    def print_room_results(self, results):
         for r in results:
-            if not isinstance(r, dict):
+            if not isinstance(r, Mapping):
                 r = {'name': r}
 
             if 'type' in r:
                 if 'format' not in r:
                     r['format'] = r['type'].title() + ': %s'
                 if r['type'] in self.config['options']['descriptions']['colors']:
-                    print(self.colors[self.config['options']['descriptions']['colors'][r['type']]])
+                    print(self.colors[self.config['options']['descriptions']['colors'][r['type']]], file=file)
             else:
-                print(BC.PURPLE)
+                print(BC.PURPLE, file=file)
 
             if 'format' not in r:
                 r['format'] = 'Roll Result: %s'
@@ -660,15 +1315,15 @@ class AROS():
             else:
                 text += r['format'] % r['name']
 
-            print(textwrap.indent(text, self.indent))
+            print(textwrap.indent(text, self.indent), file=file)
             if 'description' in r:
-                print(textwrap.indent(r['description'], self.indent))
+                print(textwrap.indent(r['description'], self.indent), file=file)
 
-        print(BC.RESET)
+        print(BC.RESET, file=file)
 
-    def parse_str_roll(self, string):
+    def parse_str_roll(self, ctx, string):
         count, die = string.split('d')
-        return self.roll_die(count=int(count), die=int(die))
+        return self.roll_die(ctx, count=int(count), die=int(die))
 
     def color(self, text, color):
         if color in self.colors:
@@ -685,16 +1340,49 @@ class AROS():
         commands = [
             'roll',
             'map',
+            'room',
+            'compile',
+            'serve',
+            'batch',
+            'odds',
+            'search',
+            'archive',
+            'shell',
+            'generate',
         ]
 
         if self.args['command'] not in commands:
             self.logger.log('Invalid command: %s, must be one of %s' % (self.args['command'], commands), level='error')
             sys.exit(1)
 
-        getattr(self, "command_%s" % self.args['command'])(self.args['args'])
+        command = getattr(self, "command_%s" % self.args['command'])
+
+        try:
+            if self.args.get('profile'):
+                import cProfile
+
+                profiler = cProfile.Profile()
+                try:
+                    profiler.runcall(command, self.args['args'])
+                finally:
+                    profiler.dump_stats(self.args['profile'])
+            else:
+                command(self.args['args'])
+        finally:
+            if self.timings:
+                self.timings.report(self.args['timings'])
 
 def main():
-    AROS().run()
+    aros = AROS()
+    try:
+        aros.run()
+    except SystemExit as e:
+        if e.code:
+            aros.logger.print_history()
+        raise
+    except Exception:
+        aros.logger.print_history()
+        raise
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,164 @@
+import os
+import json
+import random
+import multiprocessing
+from collections import deque
+
+from .results import json_default
+
+# the AROS instance loaded once in each pool process
+worker = None
+
+def init_worker(args):
+    global worker
+    from .aros import AROS
+
+    # only the parent process reports timings and profiles
+    worker = AROS(args=dict(args, log_level='error', timings=None, profile=''))
+
+def generate_map(job):
+    depth, seed, spread = job
+    ctx = worker.context(seed=seed, spread=spread)
+    map = worker.generate_map(ctx, depth)
+    return json.dumps(worker.export_map(map), default=json_default)
+
+# the archive encoder, per process, since its config index is built from the process's own config
+encoder = None
+
+def archive_map(job):
+    global encoder
+    from .archive import ConfigIndex, Encoder
+
+    if encoder is None or encoder.index.aros is not worker:
+        encoder = Encoder(ConfigIndex(worker))
+
+    depth, seed, spread = job
+    ctx = worker.context(seed=seed, spread=spread)
+    return depth, seed, encoder.encode(worker.generate_map(ctx, depth))
+
+# flattened table schemas, per process
+schemas = {}
+
+def generate_rows(job):
+    from .generate import TableSchema
+
+    path, seeds, spread = job
+    schema = schemas.get(path)
+    if schema is None or schema.aros is not worker:
+        schema = TableSchema(worker, path)
+        schemas[path] = schema
+
+    return [schema.roll(worker.context(seed=seed, spread=spread)) for seed in seeds]
+
+# names available to search predicates
+predicate_builtins = {
+    'abs': abs,
+    'all': all,
+    'any': any,
+    'int': int,
+    'len': len,
+    'max': max,
+    'min': min,
+    'set': set,
+    'sorted': sorted,
+    'str': str,
+    'sum': sum,
+}
+
+# compiled search predicates, per process
+predicates = {}
+
+def map_facts(map):
+    rooms = map['rooms']
+    facts = {
+        'depth': map['depth'],
+        'seed': map['seed'],
+        'exit': map['exit'],
+        'rooms': rooms,
+        'room_count': len(rooms),
+        'max_distance': max([r['distance'] for r in rooms]),
+        'danger': sum([r['location'].get('danger', 0) for r in rooms]),
+        'locations': [r['location']['name'] for r in rooms],
+        'situations': [r['situation']['name'] for r in rooms if 'situation' in r],
+    }
+
+    for type, name in [('creature', 'creatures'), ('encounter', 'encounters'), ('loot', 'loot'), ('trap', 'traps')]:
+        facts[name] = [
+            t['name']
+            for r in rooms
+            for part in [r['location'], r.get('situation', {})]
+            for t in part.get(type, [])
+        ]
+
+    return facts
+
+def search_map(job):
+    depth, seed, spread, where = job
+
+    if where not in predicates:
+        predicates[where] = compile(where, '<where>', 'eval')
+
+    ctx = worker.context(seed=seed, spread=spread)
+    map = worker.export_map(worker.generate_map(ctx, depth))
+    # facts go in as globals so comprehensions in the expression can see them
+    facts = map_facts(map)
+    facts['__builtins__'] = predicate_builtins
+
+    try:
+        matched = eval(predicates[where], facts)
+    except Exception as e:
+        return seed, None, '%s: %s' % (type(e).__name__, e)
+
+    if not matched:
+        return seed, None, None
+
+    summary = 'rooms: %s, exit: %s, max distance: %s, danger: %s' % (facts['room_count'], facts['exit'], facts['max_distance'], facts['danger'])
+    return seed, summary, None
+
+class Batch():
+    """Fans jobs out over a process pool, yielding results in job order with bounded buffering."""
+    def __init__(self, aros, workers=None):
+        self.aros = aros
+        self.workers = workers or os.cpu_count() or 1
+
+    def seeds(self, count, seed=None):
+        rand = random.Random(self.aros.args['seed'] if seed is None else seed)
+        for n in range(count):
+            yield self.aros.new_seed(rand)
+
+    # seeds in lists of size, for jobs too small to be worth a round trip to a worker each
+    def seed_chunks(self, count, size, seed=None):
+        chunk = []
+        for seed in self.seeds(count, seed=seed):
+            chunk.append(seed)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+
+        if chunk:
+            yield chunk
+
+    def map(self, func, jobs, window=None):
+        if self.workers <= 1:
+            global worker
+            worker = self.aros
+            for job in jobs:
+                yield func(job)
+            return
+
+        if window is None:
+            window = self.workers * 8
+
+        pool = multiprocessing.Pool(self.workers, initializer=init_worker, initargs=(self.aros.args,))
+        try:
+            pending = deque()
+            for job in jobs:
+                pending.append(pool.apply_async(func, (job,)))
+                if len(pending) >= window:
+                    yield pending.popleft().get()
+
+            while pending:
+                yield pending.popleft().get()
+        finally:
+            pool.terminate()
+            pool.join()
@@ -0,0 +1,108 @@
+import os
+import pickle
+import hashlib
+
+class ConfigCache():
+    # bump whenever the layout of a cache file changes
+    format_version = 1
+
+    def __init__(self, cache_dir=None, logger=None):
+        if not cache_dir:
+            cache_dir = os.getenv('AROS_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'aros')
+
+        self.cache_dir = cache_dir
+        self.logger = logger
+
+    def cache_path(self, source):
+        key = hashlib.sha1(source.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, 'config-%s.pickle' % key)
+
+    def load(self, source):
+        """Returns (config, content hash), parsing the yaml only when the cache is stale."""
+        source = os.path.realpath(source)
+        data, mtime = self.read_source(source)
+        digest = hashlib.sha256(data).hexdigest()
+
+        config = self.read(source, mtime, digest)
+        if config is None:
+            config = self.parse(data)
+            self.write(source, mtime, digest, config)
+
+        return config, digest
+
+    def compile(self, source):
+        source = os.path.realpath(source)
+        data, mtime = self.read_source(source)
+        digest = hashlib.sha256(data).hexdigest()
+
+        config = self.parse(data)
+        if not self.write(source, mtime, digest, config):
+            return None
+
+        return self.cache_path(source)
+
+    def read_source(self, source):
+        with open(source, 'rb') as f:
+            data = f.read()
+            mtime = os.fstat(f.fileno()).st_mtime_ns
+
+        return data, mtime
+
+    def parse(self, data):
+        from ruamel import yaml
+
+        self.log('parsing config yaml...', level='debug')
+        return yaml.load(data, Loader=yaml.Loader)
+
+    def header(self, source, mtime, digest):
+        return {
+            'format': self.format_version,
+            'path': source,
+            'mtime': mtime,
+            'hash': digest,
+        }
+
+    def read(self, source, mtime, digest):
+        path = self.cache_path(source)
+
+        try:
+            with open(path, 'rb') as f:
+                # the header is pickled separately so stale entries never unpickle the whole config
+                if pickle.load(f) != self.header(source, mtime, digest):
+                    self.log('config cache is stale: %s' % path, level='debug')
+                    return None
+                config = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            self.log('unable to read config cache %s: %s' % (path, e), level='debug')
+            return None
+
+        self.log('config cache hit: %s' % path, level='debug')
+        return config
+
+    def write(self, source, mtime, digest, config):
+        import tempfile
+
+        path = self.cache_path(source)
+
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.cache_dir, prefix='.config-', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    pickle.dump(self.header(source, mtime, digest), f, protocol=pickle.HIGHEST_PROTOCOL)
+                    pickle.dump(config, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp, path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        except OSError as e:
+            self.log('unable to write config cache %s: %s' % (path, e), level='debug')
+            return False
+
+        return True
+
+    def log(self, message, level='info'):
+        if self.logger:
+            self.logger.log(message, level=level)
@@ -0,0 +1,85 @@
+import random
+import struct
+import hashlib
+
+# random number schemes, v1 draws everything from one sequential generator seeded by the map seed
+RNG_VERSIONS = ('v1', 'v2')
+
+# the first half of a v2 stream's digest is drawn from directly, the second half seeds a generator if that runs out
+STREAM_WORDS = struct.Struct('<8I')
+
+class StreamRandom(random.Random):
+    """A v2 stream that takes its first draws straight from the blake2b digest of its key.
+
+    Room streams mostly take a few draws, so they never pay for seeding a
+    Mersenne Twister. Longer streams, like the layout, seed one once the
+    digest's words are used up.
+    """
+    def __init__(self, digest):
+        self.digest = digest
+        self.words = list(STREAM_WORDS.unpack_from(digest))
+        self.generator = None
+        self.gauss_next = None
+
+    # randint, choice and shuffle all draw through getrandbits
+    def getrandbits(self, k):
+        if k <= 32 and self.words:
+            return self.words.pop() >> (32 - k)
+        return self.fallback().getrandbits(k)
+
+    def random(self):
+        return self.fallback().random()
+
+    # once the generator is seeded it makes every later draw
+    def fallback(self):
+        if self.generator is None:
+            self.words = []
+            self.generator = random.Random(int.from_bytes(self.digest[STREAM_WORDS.size:], 'little'))
+        return self.generator
+
+class GenerationContext():
+    """Per-generation state for one map or roll, so a single AROS instance can generate concurrently."""
+    def __init__(self, seed, spread=0, rolls_on=False, rng='v1', timings=None):
+        self.seed = seed
+        self.spread = spread
+        self.rolls_on = rolls_on
+        self.rng = rng
+        self.lazy = False
+        self.timings = timings
+        self.random = self.new_random(seed)
+
+        # table path variables such as $depth and $depth_value
+        self.vars = {}
+
+        # index of the last room rolled
+        self.room_index = 0
+
+        # v1 '%s' result names as first filled, by id of the config entry, see AROS.fill_name
+        self.filled_names = {}
+
+    # v2 generator for one purpose, its draws depend only on the seed and the key, never on earlier rolls
+    def stream(self, *key):
+        data = repr((self.rng, self.seed) + key).encode('utf-8')
+        digest = hashlib.blake2b(data, digest_size=2 * STREAM_WORDS.size).digest()
+        if self.timings:
+            return self.timings.stream_random(digest)
+        return StreamRandom(digest)
+
+    def new_random(self, seed):
+        if self.timings:
+            return self.timings.random(seed)
+        return random.Random(seed)
+
+    # a copy of this context that rolls from its own stream, sharing the table path variables
+    def derive(self, *key):
+        ctx = GenerationContext.__new__(GenerationContext)
+        ctx.__dict__.update(self.__dict__)
+        ctx.random = self.stream(*key)
+        return ctx
+
+    # a copy of this context that keeps drawing from the same stream without logging each roll
+    def quiet(self):
+        ctx = GenerationContext.__new__(GenerationContext)
+        ctx.__dict__.update(self.__dict__)
+        ctx.rolls_on = False
+        return ctx
@@ -0,0 +1,69 @@
+from .rolls import TablePath
+
+class TableSchema():
+    """A table tree flattened once into columns, one per leaf table, in the order the roll command rolls them.
+
+    Each record is rolled from its own seed with the same draws as
+    `aros roll <path> -s <seed>`, so any row can be checked or rolled again.
+    """
+    def __init__(self, aros, path):
+        self.aros = aros
+        self.path = path
+        self.columns = []
+        # (die, advantage, weighted table) per column
+        self.tables = []
+
+        table = TablePath(path, aros.config['table']).table
+        if table is None:
+            raise KeyError(path)
+
+        self.flatten(table, '')
+
+    # leaves are the tables roll_results rolls, everything else is a dict of more tables
+    def flatten(self, table, prefix):
+        if not isinstance(table, (dict, list)):
+            raise ValueError('%s is not a table' % '.'.join([p for p in [self.path, prefix] if p]))
+
+        if isinstance(table, list) or 'entries' in table:
+            self.add_column(prefix or self.path.split('.')[-1], table)
+            return
+
+        for key, value in table.items():
+            self.flatten(value, '%s.%s' % (prefix, key) if prefix else str(key))
+
+    def add_column(self, name, table):
+        if isinstance(table, list):
+            entries = table
+            advantage = 0
+        else:
+            entries = table['entries']
+            advantage = table.get('advantage', 0)
+
+        weighted = self.aros.weighted_table(entries)
+        self.aros.validate_die(weighted.die)
+
+        self.columns.append(name)
+        self.tables.append((weighted.die, max(-3, min(advantage, 3)), weighted))
+
+    # one record as a row of values, drawing the dice the way roll_die and roll_table do
+    def roll(self, ctx):
+        randint = ctx.random.randint
+        spread = ctx.spread
+
+        row = [ctx.seed]
+        for die, advantage, weighted in self.tables:
+            if advantage == 0:
+                roll = randint(1, die)
+            elif advantage > 0:
+                roll = max([randint(1, die) for n in range(1 + advantage)])
+            else:
+                roll = min([randint(1, die) for n in range(1 - advantage)])
+            roll -= 1
+
+            if spread:
+                rolls = [(roll + n) % die for n in range(-spread, spread + 1)]
+                row.append(', '.join([weighted.record(r)['name'] for r in rolls]))
+            else:
+                row.append(weighted.record(roll)['name'])
+
+        return row
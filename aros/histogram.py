@@ -0,0 +1,71 @@
+from .odds import TableOdds
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class TableHistogram(TableOdds):
+    """Draws many rolls on one table, counting die values instead of building results."""
+    # rolls drawn per numpy batch, which bounds memory for any count
+    chunk_size = 1 << 20
+
+    def __init__(self, aros, table, advantage=None):
+        super().__init__(aros, table, advantage=advantage)
+        self.aros = aros
+
+    # returns counts indexed by die value - 1, with each roll's spread neighbours counted too
+    def roll(self, ctx, count, spread=0):
+        if numpy is not None:
+            counts = self.roll_numpy(ctx, count)
+        else:
+            counts = self.roll_python(ctx, count)
+
+        spread_counts = list(counts)
+        for n in range(1, spread + 1):
+            for v in range(self.die):
+                spread_counts[v] += counts[(v + n) % self.die] + counts[(v - n) % self.die]
+
+        return spread_counts
+
+    def roll_python(self, ctx, count):
+        # tallied rolls aren't shown, even with rolls on
+        quiet = ctx.quiet()
+        counts = [0] * self.die
+        for n in range(count):
+            counts[self.aros.roll_die(quiet, self.die, advantage=self.advantage) - 1] += 1
+
+        return counts
+
+    def roll_numpy(self, ctx, count):
+        # seeded from the context's stream, so every table and every call draws fresh dice
+        rng = numpy.random.default_rng(ctx.random.getrandbits(64))
+        counts = numpy.zeros(self.die, dtype=numpy.int64)
+
+        remaining = count
+        while remaining > 0:
+            size = min(remaining, self.chunk_size)
+            dice = rng.integers(1, self.die + 1, size=(size, 1 + abs(self.advantage)))
+            if self.advantage >= 0:
+                rolls = dice.max(axis=1)
+            else:
+                rolls = dice.min(axis=1)
+            counts += numpy.bincount(rolls - 1, minlength=self.die)
+            remaining -= size
+
+        return [int(c) for c in counts]
+
+    def lines(self, label, counts, spread=0):
+        total = sum(counts)
+        expected = [float(p) for p in self.faces(spread)]
+
+        yield '%s: %s results, d%s, advantage %s, spread %s' % (label, total, self.die, self.advantage, spread)
+        yield '    {0:>5} {1:>10} {2:>9} {3:>9}'.format('die', 'count', 'observed', 'expected')
+        for v in range(self.die):
+            yield '    {0:>5} {1:>10} {2:>8.3%} {3:>8.3%}'.format(v + 1, counts[v], counts[v] / total, expected[v])
+
+        yield '    {0:<40} {1:>10} {2:>9} {3:>9}'.format('entry', 'count', 'observed', 'expected')
+        for entry, low, high in self.entry_ranges():
+            name = entry['name'] if isinstance(entry, dict) else entry
+            entry_count = sum(counts[low:high])
+            yield '    {0:<40.40} {1:>10} {2:>8.3%} {3:>8.3%}'.format(str(name), entry_count, entry_count / total, sum(expected[low:high]))
@@ -0,0 +1,39 @@
+from collections.abc import Mapping
+
+class LazyRoll(Mapping):
+    """A rolled table result that is only rolled when first read, then kept."""
+    __slots__ = ('roll', 'args', 'result')
+
+    def __init__(self, roll, *args):
+        self.roll = roll
+        self.args = args
+        self.result = None
+
+    @property
+    def rolled(self):
+        return self.result is not None
+
+    def resolve(self):
+        if self.result is None:
+            self.result = self.roll(*self.args)
+            self.roll = None
+            self.args = None
+
+        return self.result
+
+    def __getitem__(self, key):
+        return self.resolve()[key]
+
+    def __contains__(self, key):
+        return key in self.resolve()
+
+    def __iter__(self):
+        return iter(self.resolve())
+
+    def __len__(self):
+        return len(self.resolve())
+
+    def __repr__(self):
+        if self.result is None:
+            return '<LazyRoll unrolled>'
+        return repr(self.result)
@@ -1,13 +1,15 @@
-class Logger():
-    def __init__(self, level='info'):
-        self.level = level
+import sys
+from collections import deque
 
+class Logger():
+    def __init__(self, level='info', history=0):
         self.levels = [
             'debug',
             'info',
             'warn',
             'error',
         ]
+        self.ranks = {l: i for i, l in enumerate(self.levels)}
         self.level_config = {
             'debug': {
                 'prefix': 'DEBUG: ',
@@ -21,9 +23,52 @@ class Logger():
             },
         }
 
-    def log(self, message='', level='info'):
-        if self.levels.index(level) >= self.levels.index(self.level):
-            if 'prefix' in self.level_config[level] and self.level_config[level]['prefix']:
-                message = self.level_config[level]['prefix'] + message
+        self.level = level
+
+        # the last N events at any level, kept unformatted so recording them stays cheap
+        self.history = deque(maxlen=history) if history else None
+
+    @property
+    def level(self):
+        return self._level
+
+    @level.setter
+    def level(self, level):
+        self._level = level
+        self.threshold = self.ranks[level]
+
+    # true when a message at this level would be printed or recorded, for guarding expensive arguments
+    def is_enabled(self, level):
+        return self.ranks[level] >= self.threshold or self.history is not None
+
+    # message may be a %-format with args, or a callable returning the message, neither is built unless needed
+    def log(self, message='', *args, level='info'):
+        rank = self.ranks[level]
+
+        if self.history is not None:
+            self.history.append((level, message, args))
+
+        if rank >= self.threshold:
+            message = self.format(message, args)
+            prefix = self.level_config[level].get('prefix')
+            if prefix:
+                message = prefix + message
 
             print(message)
+
+    def format(self, message, args):
+        if callable(message):
+            message = message()
+        if args:
+            message = message % args
+        return message
+
+    # messages are formatted now, so they show values as they are at this point
+    def print_history(self, file=None):
+        if not self.history:
+            return
+
+        file = file or sys.stderr
+        print('Last %s log events:' % len(self.history), file=file)
+        for level, message, args in self.history:
+            print('%s%s' % (self.level_config[level].get('prefix') or '', self.format(message, args)), file=file)
@@ -0,0 +1,122 @@
+import os
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+
+# bump whenever seeded generation changes, so disk entries written by older code are never read
+format_version = 1
+
+class MapCache():
+    """A bounded LRU of generated maps and rendered map text, with an optional pickle file per entry on disk.
+
+    Generation is deterministic, so keys are built from everything a map depends
+    on, including the config hash, and entries for old tables are never hit.
+    """
+    def __init__(self, max_entries=256, cache_dir=None, logger=None):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.logger = logger
+
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # kind separates structured maps, layouts and rendered text of the same map
+    def key(self, kind, depth, seed, spread, rng, config_hash):
+        return (format_version, kind, depth, seed, spread, rng, config_hash)
+
+    def get(self, key, build):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+
+        value = self.read(key)
+        if value is not None:
+            with self.lock:
+                self.disk_hits += 1
+        else:
+            with self.lock:
+                self.misses += 1
+            value = build()
+            self.write(key, value)
+
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, 'map-%s.pickle' % hashlib.sha1(repr(key).encode('utf-8')).hexdigest())
+
+    def read(self, key):
+        if not self.cache_dir:
+            return None
+
+        try:
+            with open(self.path(key), 'rb') as f:
+                stored_key, value = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            self.log('unable to read map cache for %s: %s' % (key, e), level='debug')
+            return None
+
+        return value if stored_key == key else None
+
+    def write(self, key, value):
+        if not self.cache_dir:
+            return
+
+        import tempfile
+
+        path = self.path(key)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.cache_dir, prefix='.map-', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    pickle.dump((key, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp, path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        except OSError as e:
+            self.log('unable to write map cache %s: %s' % (path, e), level='debug')
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                'disk': bool(self.cache_dir),
+            }
+
+    def log(self, message, level='info'):
+        if self.logger:
+            self.logger.log(message, level=level)
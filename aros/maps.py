@@ -0,0 +1,179 @@
+from array import array
+
+# hall bits per cell, in the order the map walk tries directions
+DIRECTIONS = ('W', 'N', 'E', 'S')
+HALL_BITS = {
+    'W': 1,
+    'N': 2,
+    'E': 4,
+    'S': 8,
+}
+OPPOSITES = {
+    'W': 'E',
+    'N': 'S',
+    'E': 'W',
+    'S': 'N',
+}
+STEPS = {
+    'W': (-1, 0),
+    'N': (0, -1),
+    'E': (1, 0),
+    'S': (0, 1),
+}
+
+class Room():
+    __slots__ = ('index', 'x', 'y', 'location', 'situation', 'exit', 'hallways', 'distance')
+
+    def __init__(self, index, location, situation=None, hallways=0, distance=0, exit=None):
+        self.index = index
+        self.x = None
+        self.y = None
+        self.location = location
+        self.situation = situation
+        self.exit = exit
+        self.hallways = hallways
+        self.distance = distance
+
+    def export(self):
+        room = {
+            'index': self.index,
+            'location': self.location,
+        }
+        if self.situation is not None:
+            room['situation'] = self.situation
+        if self.exit is not None:
+            room['exit'] = self.exit
+        room['hallways'] = self.hallways
+
+        return room
+
+    def __repr__(self):
+        return '<Room %s %s at %s, %s>' % (self.index, self.location['name'], self.x, self.y)
+
+class Map():
+    """A generated map. Rooms are kept in generation order, and the grid is two flat arrays.
+
+    cells holds each cell's index into rooms, or -1, and halls holds a
+    4-bit mask of each cell's hallways.
+    """
+    __slots__ = ('depth', 'seed', 'exit', 'size', 'cells', 'halls', 'rooms', 'retries')
+
+    def __init__(self, depth, seed, size, exit=None):
+        self.depth = depth
+        self.seed = seed
+        self.exit = exit
+        self.size = size
+        self.cells = array('i', [-1]) * (size * size)
+        self.halls = array('B', bytes(size * size))
+        self.rooms = []
+        # rooms rerolled to meet constraints
+        self.retries = 0
+
+    def add(self, room, x, y):
+        room.x = x
+        room.y = y
+        self.cells[y * self.size + x] = len(self.rooms)
+        self.rooms.append(room)
+
+    def at(self, x, y):
+        if x < 0 or y < 0 or x >= self.size or y >= self.size:
+            return None
+
+        n = self.cells[y * self.size + x]
+        return self.rooms[n] if n >= 0 else None
+
+    # the cell one step away, or None past the edge of the map
+    def neighbor(self, x, y, direction):
+        step = STEPS[direction]
+        x += step[0]
+        y += step[1]
+        if x < 0 or y < 0 or x >= self.size or y >= self.size:
+            return None
+
+        return x, y
+
+    def hall_mask(self, x, y):
+        return self.halls[y * self.size + x]
+
+    def has_hall(self, x, y, direction):
+        return bool(self.halls[y * self.size + x] & HALL_BITS[direction])
+
+    # opens a hall from a cell and back from its neighbor
+    def connect(self, x, y, direction):
+        step = STEPS[direction]
+        self.halls[y * self.size + x] |= HALL_BITS[direction]
+        self.halls[(y + step[1]) * self.size + x + step[0]] |= HALL_BITS[OPPOSITES[direction]]
+
+    # the in bounds cells next to a cell that have no room yet
+    def open_neighbors(self, x, y):
+        cells = []
+        for direction in DIRECTIONS:
+            cell = self.neighbor(x, y, direction)
+            if cell is not None and self.cells[cell[1] * self.size + cell[0]] < 0:
+                cells.append(cell)
+
+        return cells
+
+    def hall_list(self, x, y):
+        mask = self.halls[y * self.size + x]
+        return [d for d in DIRECTIONS if mask & HALL_BITS[d]]
+
+    def export_room(self, room):
+        exported = room.export()
+        exported['distance'] = room.distance
+        exported['halls'] = self.hall_list(room.x, room.y)
+        exported['x'] = room.x
+        exported['y'] = room.y
+
+        return exported
+
+class MapConstraints():
+    """Limits a generated map has to meet, checked after the walk and as rooms are rolled.
+
+    Unset limits are None. max_retries bounds the rerolls for the whole map, and
+    room_retries the rerolls of any one room.
+    """
+    __slots__ = ('min_rooms', 'max_rooms', 'exit_reachable', 'max_danger', 'max_distance', 'max_retries', 'room_retries')
+
+    def __init__(self, min_rooms=None, max_rooms=None, exit_reachable=False, max_danger=None, max_distance=4, max_retries=20, room_retries=3):
+        self.min_rooms = min_rooms
+        self.max_rooms = max_rooms
+        self.exit_reachable = exit_reachable
+        self.max_danger = max_danger
+        self.max_distance = max_distance
+        self.max_retries = max_retries
+        self.room_retries = room_retries
+
+    def danger(self, rooms):
+        return sum([room.location.get('danger', 0) for room in rooms])
+
+    def full(self, map):
+        return self.max_rooms is not None and len(map.rooms) >= self.max_rooms
+
+    # whether a room rolled onto the map keeps it within the danger budget
+    def fits(self, map, room):
+        return self.max_danger is None or self.danger(map.rooms) + room.location.get('danger', 0) <= self.max_danger
+
+    # the walk never goes past the max distance, so a farther exit only needs a room at the max distance
+    def exit_distance(self, map):
+        return min(map.exit, self.max_distance)
+
+    # descriptions of the constraints the map doesn't meet
+    def unmet(self, map):
+        unmet = []
+        rooms = len(map.rooms)
+
+        if self.min_rooms is not None and rooms < self.min_rooms:
+            unmet.append('min rooms %s (has %s)' % (self.min_rooms, rooms))
+        if self.max_rooms is not None and rooms > self.max_rooms:
+            unmet.append('max rooms %s (has %s)' % (self.max_rooms, rooms))
+        if self.exit_reachable:
+            distance = max([room.distance for room in map.rooms])
+            if distance < self.exit_distance(map):
+                unmet.append('exit distance %s (reaches %s)' % (self.exit_distance(map), distance))
+        if self.max_danger is not None:
+            danger = self.danger(map.rooms)
+            if danger > self.max_danger:
+                unmet.append('max danger %s (has %s)' % (self.max_danger, danger))
+
+        return unmet
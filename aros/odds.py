@@ -0,0 +1,92 @@
+from fractions import Fraction
+
+def binomial(n, k):
+    result = 1
+    for i in range(1, k + 1):
+        result = result * (n - k + i) // i
+    return result
+
+# exact distribution of roll_die's result: roll count + |advantage| dice and keep the best (or worst) count of them
+def dice_distribution(die, count=1, advantage=0):
+    advantage = max(-3, min(advantage, 3))
+    n = count + abs(advantage)
+
+    # faces are visited from the kept end, so the first count dice assigned are the kept ones
+    if advantage >= 0:
+        faces = range(die, 0, -1)
+    else:
+        faces = range(1, die + 1)
+
+    # (dice assigned so far, sum of kept dice) -> number of ordered outcomes
+    states = {(0, 0): 1}
+    distribution = {}
+    outcomes = die ** n
+
+    for faces_left, face in enumerate(faces, 1):
+        faces_left = die - faces_left
+        next_states = {}
+        for (assigned, total), ways in states.items():
+            kept = min(assigned, count)
+            for j in range(n - assigned + 1):
+                key = (assigned + j, total + face * (min(assigned + j, count) - kept))
+                next_states[key] = next_states.get(key, 0) + ways * binomial(n - assigned, j)
+
+        states = {}
+        for (assigned, total), ways in next_states.items():
+            if assigned >= count:
+                # every kept die is placed, the dropped ones can land on any face left
+                ways *= faces_left ** (n - assigned)
+                distribution[total] = distribution.get(total, 0) + ways
+            else:
+                states[(assigned, total)] = ways
+
+    distribution = {total: Fraction(ways, outcomes) for total, ways in distribution.items() if ways}
+
+    return [(total, distribution[total]) for total in sorted(distribution)]
+
+class TableOdds():
+    """Exact per-result odds of a table roll, through its frequency weights, advantage and spread."""
+    def __init__(self, aros, table, advantage=None):
+        if isinstance(table, list):
+            entries = table
+            table = {}
+        else:
+            entries = table['entries']
+
+        # same advantage rules as roll_table and roll_die
+        adv = 0
+        if 'advantage' in table:
+            adv = table['advantage']
+        if advantage != None:
+            adv = advantage
+        self.advantage = max(-3, min(adv, 3))
+
+        self.weighted = aros.weighted_table(entries)
+        self.die = self.weighted.die
+        aros.validate_die(self.die)
+
+    # probability of each die value 1..die appearing as any one of a roll's 2 * spread + 1 results
+    def faces(self, spread=0):
+        faces = [p for total, p in dice_distribution(self.die, advantage=self.advantage)]
+
+        spread_faces = list(faces)
+        for n in range(1, spread + 1):
+            for v in range(self.die):
+                spread_faces[v] += faces[(v + n) % self.die] + faces[(v - n) % self.die]
+
+        return [p / (2 * spread + 1) for p in spread_faces]
+
+    # pairs each entry with its die value range, skipping entries with no weight
+    def entry_ranges(self):
+        ranges = []
+        low = 0
+        for i, high in enumerate(self.weighted.cumulative):
+            if high > low:
+                ranges.append((self.weighted.entries[i], low, high))
+            low = high
+
+        return ranges
+
+    def entries(self, spread=0):
+        faces = self.faces(spread)
+        return [(entry, low, high, sum(faces[low:high])) for entry, low, high in self.entry_ranges()]
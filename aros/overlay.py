@@ -0,0 +1,84 @@
+import os
+import hashlib
+import threading
+
+# overlay values replace base values, except dicts, which merge key by key so an overlay only lists the tables it changes
+# merged dicts are new and everything the overlay doesn't touch is shared with the base, lists are replaced whole
+def merge(base, overlay):
+    if not isinstance(base, dict) or not isinstance(overlay, dict):
+        return overlay
+
+    merged = dict(base)
+    for key, value in overlay.items():
+        if key in base:
+            merged[key] = merge(base[key], value)
+        else:
+            merged[key] = value
+
+    return merged
+
+# ids of every dict and list in a config, compiled tables keyed by anything else are stale
+def config_ids(config):
+    ids = set()
+    stack = [config]
+    while stack:
+        node = stack.pop()
+        if id(node) in ids:
+            continue
+        ids.add(id(node))
+
+        children = node.values() if isinstance(node, dict) else node
+        stack.extend([c for c in children if isinstance(c, (dict, list))])
+
+    return ids
+
+class ConfigLayers():
+    """The base config file and its overlays, each loaded on its own so a change only reloads that file.
+
+    load is called with a path and returns (config, content hash), refresh
+    polls the files' mtimes.
+    """
+    def __init__(self, paths, load):
+        self.paths = [os.path.realpath(path) for path in paths]
+        self.load = load
+        self.lock = threading.Lock()
+
+        self.layers = [None] * len(self.paths)
+        self.mtimes = [None] * len(self.paths)
+
+    def mtime(self, path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    # loads the layers whose files changed since they were last loaded, returns whether any did
+    def refresh(self):
+        with self.lock:
+            changed = False
+            for n, path in enumerate(self.paths):
+                mtime = self.mtime(path)
+                if self.layers[n] is not None and mtime == self.mtimes[n]:
+                    continue
+
+                # a file that fails to load keeps its old layer, and isn't tried again until it changes
+                self.mtimes[n] = mtime
+                self.layers[n] = self.load(path)
+                changed = True
+
+            return changed
+
+    # (config, hash) of the layers merged in order, a lone file keeps its own hash
+    def merged(self):
+        with self.lock:
+            config, digest = self.layers[0]
+            if len(self.layers) == 1:
+                return config, digest
+
+            for overlay, overlay_digest in self.layers[1:]:
+                # an empty overlay file loads as None
+                if overlay is not None:
+                    config = merge(config, overlay)
+
+            digests = '\n'.join([layer[1] for layer in self.layers])
+            return config, hashlib.sha256(digests.encode('utf-8')).hexdigest()
@@ -0,0 +1,166 @@
+from .maps import HALL_BITS
+
+N = HALL_BITS['N']
+E = HALL_BITS['E']
+S = HALL_BITS['S']
+W = HALL_BITS['W']
+
+class TileRenderer():
+    """Draws map cells as lists of text lines, memoizing identical tiles."""
+    # memoized tiles kept before the memo is cleared, so long running servers stay bounded
+    max_tiles = 4096
+
+    def __init__(self, aros):
+        options = aros.config['options']
+
+        self.color = aros.color
+        self.color_order = aros.color_order
+
+        self.height = options['map_print_room_rows']
+        self.width = options['map_print_room_cols']
+        self.half_height = int(self.height / 2)
+        self.half_width = int(self.width / 2)
+        self.creatures_per_line = options['map_print_creatures_per_line']
+        self.trap_color = options['descriptions']['colors']['trap']
+        self.creature_color = options['descriptions']['colors']['creature']
+
+        if 'map_print_fill' in options:
+            fill = options['map_print_fill']
+        else:
+            fill = '░'
+        if not isinstance(fill, list):
+            fill = [fill]
+        self.fill = fill
+
+        self.line_format = '{0:<%s.%s}' % (self.width - 4, self.width - 4)
+        self.index_format = '{0:>2.2}'
+        self.title_format = '{0:<%s.%s}' % (self.width - 7, self.width - 7)
+
+        self.tiles = {}
+
+    # room is None for an empty cell, halls is the cell's hall mask
+    def tile(self, room, halls=0):
+        key = self.tile_key(room, halls)
+
+        lines = self.tiles.get(key)
+        if lines is None:
+            if len(self.tiles) >= self.max_tiles:
+                self.tiles.clear()
+            lines = self.draw(room, halls)
+            self.tiles[key] = lines
+
+        return lines
+
+    # everything a tile's text depends on
+    def tile_key(self, room, halls):
+        if room is None:
+            return None
+
+        location = room.location
+        return (
+            halls,
+            location.get('danger'),
+            room.index,
+            location['name'],
+            room.situation['name'] if room.situation is not None else None,
+            room.situation is not None,
+            room.exit,
+            tuple([t['name'] for t in location['trap']]) if 'trap' in location else None,
+            tuple([c['name'] for c in location['creature']]) if 'creature' in location else None,
+        )
+
+    def draw(self, room, halls):
+        height = self.height
+        width = self.width
+        half_height = self.half_height
+        half_width = self.half_width
+
+        if room is None:
+            return self.fill_lines([self.color(self.fill[0] * width, 'blue')] * height)
+
+        location = room.location
+        if 'danger' in location:
+            color = self.color_order[location['danger'] + 3]
+        else:
+            color = self.color_order[0]
+
+        lines = [None] * height
+
+        lines[0] = '%s%s%s' % (' ' * half_width, self.color('║', color) if halls & N else ' ', ' ' * half_width)
+        room_top = '╔%s%s%s╗' % ('═' * (half_width - 2), '╩' if halls & N else '═', '═' * (half_width - 2))
+        lines[1] = ' %s ' % self.color(room_top, color)
+
+        room_bottom = '╚%s%s%s╝' % ('═' * (half_width - 2), '╦' if halls & S else '═', '═' * (half_width - 2))
+        lines[height - 2] = ' %s ' % self.color(room_bottom, color)
+        lines[height - 1] = '%s%s%s' % (' ' * half_width, self.color('║', color) if halls & S else ' ', ' ' * half_width)
+
+        text_lines = []
+        index = self.color(self.index_format.format(str(room.index)), 'bold')
+        title = self.color(self.title_format.format(location['name']), 'underline')
+        text_lines.append(index + ' ' + title)
+        if room.situation is not None:
+            text_lines.append(self.color(self.line_format.format('%s' % room.situation['name']), 'blue'))
+        if room.exit is not None:
+            text_lines.append(self.line_format.format('Exit: %s' % room.exit))
+
+        misc_lines = height - 6
+
+        if 'trap' in location and misc_lines > 0:
+            trap_line = ', '.join([t['name'] for t in location['trap']])
+            text_lines.append(self.color(self.line_format.format(trap_line), self.trap_color))
+            misc_lines -= 1
+
+        if 'creature' in location:
+            creatures = location['creature']
+            for i in range(0, len(creatures), self.creatures_per_line):
+                if misc_lines <= 0:
+                    break
+                creature_line = ', '.join([c['name'] for c in creatures[i:i + self.creatures_per_line]])
+                text_lines.append(self.color(self.line_format.format(creature_line), self.creature_color))
+                misc_lines -= 1
+
+        wall = self.color('║', color)
+        west_wall = ' ' + wall
+        east_wall = wall + ' '
+        blank = ' ' * (width - 4)
+
+        for n in range(2, height - 2):
+            if n == half_height and halls & W:
+                line = self.color('═╣', color)
+            else:
+                line = west_wall
+
+            if n - 2 < len(text_lines):
+                line += text_lines[n - 2]
+            else:
+                line += blank
+
+            if n == half_height and halls & E:
+                line += self.color('╠═', color)
+            else:
+                line += east_wall
+
+            lines[n] = line
+
+        return self.fill_lines(lines)
+
+    # swaps the spaces at either end of each line for the fill pattern, the pattern is offset by line and column
+    def fill_lines(self, lines):
+        fill = self.fill
+        filled = []
+
+        for l, line in enumerate(lines):
+            length = len(line)
+            lead = length - len(line.lstrip(' '))
+            if lead == length:
+                filled.append(''.join([fill[(l + i) % len(fill)] for i in range(length)]))
+                continue
+
+            trail = length - len(line.rstrip(' '))
+            filled.append('%s%s%s' % (
+                ''.join([fill[(l + i) % len(fill)] for i in range(lead)]),
+                line[lead:length - trail],
+                ''.join([fill[(l + i) % len(fill)] for i in range(length - trail, length)]),
+            ))
+
+        return filled
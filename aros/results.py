@@ -0,0 +1,88 @@
+from collections.abc import Mapping
+
+# table level keys a rolled entry inherits when it doesn't set its own
+INHERITED_KEYS = (
+    'advantage',
+    'count',
+    'format',
+    'roll',
+    'type',
+)
+
+MISSING = object()
+
+class RollResult(Mapping):
+    """One rolled table entry, read like the entry dict it was rolled from.
+
+    The entry and its table belong to the shared config and are never
+    written to; the die value is kept alongside, and anything set on the
+    result (names filled in by rolls, nested results) goes to its own fields.
+    Keys iterate in the order a copy of the entry would have them.
+    """
+    __slots__ = ('entry', 'die', 'table', 'fields')
+
+    def __init__(self, entry, die=None, table=None):
+        self.entry = entry
+        self.die = die
+        self.table = table
+        self.fields = None
+
+    def get(self, key, default=None):
+        fields = self.fields
+        if fields is not None:
+            value = fields.get(key, MISSING)
+            if value is not MISSING:
+                return value
+        if key == 'die' and self.die is not None:
+            return self.die
+        value = self.entry.get(key, MISSING)
+        if value is not MISSING:
+            return value
+        if self.table and key in INHERITED_KEYS:
+            return self.table.get(key, default)
+        return default
+
+    def __getitem__(self, key):
+        value = self.get(key, MISSING)
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, MISSING) is not MISSING
+
+    def __setitem__(self, key, value):
+        if self.fields is None:
+            self.fields = {}
+        self.fields[key] = value
+
+    def __iter__(self):
+        seen = set(self.entry)
+        yield from self.entry
+
+        if self.die is not None and 'die' not in seen:
+            seen.add('die')
+            yield 'die'
+
+        if self.table:
+            for key in INHERITED_KEYS:
+                if key in self.table and key not in seen:
+                    seen.add(key)
+                    yield key
+
+        if self.fields:
+            for key in self.fields:
+                if key not in seen:
+                    yield key
+
+    def __len__(self):
+        return sum(1 for key in self)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+# for json.dumps, which only knows plain dicts
+def json_default(value):
+    if isinstance(value, Mapping):
+        return dict(value)
+    return str(value)
@@ -0,0 +1,75 @@
+from .results import MISSING
+
+# whether roll can take a value: a table (a list, or a dict with entries), or a dict of nothing but tables
+def rollable(value):
+    if isinstance(value, list):
+        return True
+    if not isinstance(value, dict) or not value:
+        return False
+
+    return 'entries' in value or all([rollable(v) for v in value.values()])
+
+class TablePath():
+    """A dotted table path split once. Paths without $var segments resolve to their table up front."""
+    __slots__ = ('path', 'keys', 'table')
+
+    def __init__(self, path, root):
+        self.path = path
+
+        # (key, variable name) pairs, only $var segments are looked up per roll
+        self.keys = []
+        for key in path.split('.'):
+            if key.isdigit():
+                key = int(key)
+            if key:
+                var = key[1:] if isinstance(key, str) and key.startswith('$') else None
+                self.keys.append((key, var))
+
+        self.table = None
+        if not any(var for key, var in self.keys):
+            try:
+                self.table = self.resolve(root, {})
+            except (KeyError, IndexError, TypeError):
+                # left to fail when it is rolled, as it always has
+                pass
+
+    def resolve(self, root, vars):
+        if self.table is not None:
+            return self.table
+
+        data = root
+        for key, var in self.keys:
+            data = data[vars[var] if var else key]
+
+        return data
+
+class RollSpec():
+    """One entry of a `roll:` key normalized once, the config itself is left as written."""
+    __slots__ = ('count', 'advantage', 'results', 'tables', 'args', 'format')
+
+    def __init__(self, roll, root):
+        if not isinstance(roll, dict):
+            roll = {'table': roll}
+
+        self.count = roll.get('count', 1)
+        self.advantage = roll.get('advantage', 0)
+
+        self.results = []
+        if 'result' in roll:
+            self.results = roll['result'] if isinstance(roll['result'], list) else [roll['result']]
+
+        self.tables = MISSING
+        self.args = MISSING
+        if 'table' in roll:
+            tables = roll['table'] if isinstance(roll['table'], list) else [roll['table']]
+            self.tables = [TablePath(t, root) for t in tables]
+        elif 'args' in roll:
+            self.args = roll['args']
+
+        self.format = roll.get('format', MISSING)
+
+def compile_rolls(rolls, root):
+    if not isinstance(rolls, list):
+        rolls = [rolls]
+
+    return [RollSpec(roll, root) for roll in rolls]
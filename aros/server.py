@@ -0,0 +1,285 @@
+import json
+import time
+import threading
+from socketserver import ThreadingMixIn
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from .rolls import rollable
+from .context import RNG_VERSIONS
+from .results import json_default
+
+class RequestStats():
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.in_flight = 0
+        self.endpoints = {}
+
+    def begin(self):
+        with self.lock:
+            self.in_flight += 1
+
+        return time.perf_counter()
+
+    def end(self, endpoint, started, error=False):
+        elapsed = time.perf_counter() - started
+
+        with self.lock:
+            self.in_flight -= 1
+
+            if endpoint not in self.endpoints:
+                self.endpoints[endpoint] = {
+                    'requests': 0,
+                    'errors': 0,
+                    'total_seconds': 0.0,
+                    'max_seconds': 0.0,
+                }
+            stats = self.endpoints[endpoint]
+            stats['requests'] += 1
+            stats['total_seconds'] += elapsed
+            stats['max_seconds'] = max(stats['max_seconds'], elapsed)
+            if error:
+                stats['errors'] += 1
+
+    def snapshot(self):
+        with self.lock:
+            uptime = time.time() - self.started
+            endpoints = {}
+            for endpoint, stats in self.endpoints.items():
+                endpoints[endpoint] = {
+                    'requests': stats['requests'],
+                    'errors': stats['errors'],
+                    'requests_per_second': stats['requests'] / uptime if uptime else 0.0,
+                    'mean_ms': 1000 * stats['total_seconds'] / stats['requests'],
+                    'max_ms': 1000 * stats['max_seconds'],
+                }
+
+            return {
+                'uptime_seconds': uptime,
+                'in_flight': self.in_flight,
+                'requests': sum([e['requests'] for e in endpoints.values()]),
+                'endpoints': endpoints,
+            }
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        endpoint = url.path.strip('/')
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+        routes = {
+            'map': self.server.aros_server.map,
+            'room': self.server.aros_server.room,
+            'roll': self.server.aros_server.roll,
+            'stats': self.server.aros_server.stats,
+        }
+
+        if endpoint not in routes:
+            self.respond(404, {'error': 'unknown endpoint: /%s, must be one of %s' % (endpoint, sorted(routes))})
+            return
+
+        stats = self.server.aros_server.request_stats
+        started = stats.begin()
+        error = True
+        try:
+            self.respond(200, routes[endpoint](params))
+            error = False
+        except RequestError as e:
+            self.respond(e.status, {'error': str(e)})
+        except (Exception, SystemExit) as e:
+            self.respond(500, {'error': '%s: %s' % (type(e).__name__, e)})
+        finally:
+            stats.end(endpoint, started, error=error)
+
+    def respond(self, status, body):
+        data = json.dumps(body, default=json_default).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        self.server.aros_server.aros.logger.log(format % args, level='debug')
+
+class Server():
+    """Serves generations over a loaded AROS instance.
+
+    A config reload swaps in a new instance, each request reads self.aros
+    once so it finishes on the config it started with.
+    """
+    def __init__(self, aros, host='127.0.0.1', port=8080, cache=None, reload_interval=0):
+        self.aros = aros
+        self.cache = cache
+        self.request_stats = RequestStats()
+        self.reload_interval = reload_interval
+        self.reloads = 0
+        self.stopped = threading.Event()
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.aros_server = self
+        self.address = self.httpd.server_address[:2]
+
+    def serve_forever(self):
+        if self.reload_interval > 0:
+            threading.Thread(target=self.watch_config, daemon=True).start()
+
+        try:
+            self.httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stopped.set()
+            self.httpd.server_close()
+
+    def shutdown(self):
+        self.stopped.set()
+        self.httpd.shutdown()
+
+    # polls the config files' mtimes, swapping in a reloaded instance when one changes
+    def watch_config(self):
+        while not self.stopped.wait(self.reload_interval):
+            # a failed reload keeps the loaded config, the watcher carries on with the next change
+            try:
+                self.reload_config()
+            except Exception as e:
+                self.aros.logger.log('Unable to reload config, keeping the loaded one: %s: %s' % (type(e).__name__, e), level='error')
+
+    def reload_config(self):
+        aros = self.aros.reloaded()
+        if aros is None:
+            return False
+
+        self.aros = aros
+        self.reloads += 1
+        # cached maps are keyed on the old config hash, so they could only be evicted
+        if self.cache is not None:
+            self.cache.clear()
+        aros.logger.log('Reloaded config %s' % aros.config_hash)
+
+        return True
+
+    # each request gets its own seeded generation context over the shared config
+    def context(self, aros, params):
+        try:
+            spread = int(params.get('spread', 0))
+        except ValueError:
+            raise RequestError(400, 'spread must be an integer')
+
+        rng = params.get('rng', aros.args.get('rng') or 'v1')
+        if rng not in RNG_VERSIONS:
+            raise RequestError(400, 'unknown rng: %s, must be one of %s' % (rng, list(RNG_VERSIONS)))
+
+        return aros.context(seed=params.get('seed', ''), spread=spread, rng=rng)
+
+    def depth(self, aros, params):
+        if 'depth' not in params:
+            raise RequestError(400, 'missing parameter: depth')
+
+        depths = [d['name'] for d in aros.config['depths']]
+        if params['depth'] not in depths:
+            raise RequestError(404, 'unknown depth: %s, must be one of %s' % (params['depth'], depths))
+
+        return params['depth']
+
+    # layout=1 returns only the topology, which v2 maps generate without rolling room contents
+    # format=text returns the map as the map command prints it
+    def map(self, params):
+        aros = self.aros
+        depth = self.depth(aros, params)
+        ctx = self.context(aros, params)
+
+        if params.get('layout') in ['1', 'true']:
+            kind = 'layout'
+            build = lambda: aros.export_layout(aros.generate_map(ctx, depth, lazy=True))
+        elif params.get('format') == 'text':
+            kind = 'text'
+            build = lambda: {
+                'depth': depth,
+                'seed': ctx.seed,
+                'text': aros.render_map(aros.generate_map(ctx, depth)),
+            }
+        else:
+            kind = 'map'
+            build = lambda: aros.export_map(aros.generate_map(ctx, depth))
+
+        # maps for random seeds would only push out the ones players come back to
+        if self.cache is None or not params.get('seed'):
+            return build()
+
+        key = self.cache.key(kind, depth, ctx.seed, ctx.spread, ctx.rng, aros.config_hash)
+        return self.cache.get(key, build)
+
+    def room(self, params):
+        aros = self.aros
+        depth = self.depth(aros, params)
+        ctx = self.context(aros, params)
+        if ctx.rng == 'v1':
+            raise RequestError(400, 'single rooms need rng=v2')
+
+        try:
+            index = int(params.get('index', ''))
+        except ValueError:
+            raise RequestError(400, 'index must be an integer')
+        if index < 0:
+            raise RequestError(400, 'index must not be negative')
+
+        rooms = aros.room_count(ctx, depth)
+        if index >= rooms:
+            raise RequestError(404, 'no room %s, the map has %s rooms' % (index, rooms))
+
+        room = aros.generate_room(ctx, depth, index)
+        return {
+            'depth': depth,
+            'seed': ctx.seed,
+            'room': room.export(),
+        }
+
+    def roll(self, params):
+        if 'table' not in params:
+            raise RequestError(400, 'missing parameter: table')
+
+        aros = self.aros
+        ctx = self.context(aros, params)
+        try:
+            table = aros.dig(ctx, aros.config['table'], params['table'])
+        except (KeyError, IndexError, TypeError):
+            raise RequestError(404, 'unknown table: %s' % params['table'])
+        if not rollable(table):
+            raise RequestError(404, '%s is not a table' % params['table'])
+
+        results = []
+        for label, text, result in aros.roll_results(ctx, label=params['table'], table=table):
+            results.append({
+                'table': label,
+                'text': text,
+                'results': result,
+            })
+
+        return {
+            'seed': ctx.seed,
+            'table': params['table'],
+            'results': results,
+        }
+
+    def stats(self, params):
+        stats = self.request_stats.snapshot()
+        stats['config'] = {
+            'hash': self.aros.config_hash,
+            'reloads': self.reloads,
+        }
+        if self.cache is not None:
+            stats['map_cache'] = self.cache.stats()
+        if self.aros.timings:
+            stats['timings'] = self.aros.timings.snapshot()
+
+        return stats
@@ -0,0 +1,183 @@
+import cmd
+from bisect import bisect_left
+
+from .rolls import rollable
+
+# every dotted path under the tables that roll can take, sorted for prefix lookups
+def table_paths(tables, prefix=''):
+    paths = []
+    for key, value in tables.items():
+        path = '%s%s' % (prefix, key)
+        if rollable(value):
+            paths.append(path)
+        if isinstance(value, dict) and 'entries' not in value:
+            paths.extend(table_paths(value, path + '.'))
+
+    if not prefix:
+        paths.sort()
+
+    return paths
+
+def complete_from(options, text):
+    options_from = bisect_left(options, text)
+    matches = []
+    for option in options[options_from:]:
+        if not option.startswith(text):
+            break
+        matches.append(option)
+
+    return matches
+
+class Shell(cmd.Cmd):
+    """An interactive session that keeps the config, its caches and the seeded random stream loaded between commands.
+
+    Rolls carry on from the session's stream, so the same seed and the same
+    commands give the same results. Maps always start from the seed, and the
+    current map keeps the config it was generated with.
+    """
+    intro = 'aros shell, type help or ? to list commands'
+    prompt = 'aros> '
+
+    def __init__(self, aros, stdin=None, stdout=None):
+        super().__init__(stdin=stdin, stdout=stdout)
+        if stdin is not None:
+            self.use_rawinput = False
+
+        self.aros = aros
+        self.paths = table_paths(aros.config['table'])
+        self.depths = sorted([d['name'] for d in aros.config['depths']])
+
+        self.map = None
+        self.map_ctx = None
+        self.map_aros = None
+        self.attempts = {}
+        self.reseed(aros.args['seed'])
+
+    def reseed(self, seed):
+        self.aros.args['seed'] = seed
+        self.ctx = self.aros.context(seed=seed)
+
+    def log(self, message, level='info'):
+        self.aros.logger.log(message, level=level)
+
+    # config files are checked before each command, a reload swaps the whole instance and keeps the session's stream
+    def precmd(self, line):
+        if self.aros.args.get('reload_interval'):
+            aros = self.aros.reloaded()
+            if aros is not None:
+                self.aros = aros
+                self.paths = table_paths(aros.config['table'])
+                self.depths = sorted([d['name'] for d in aros.config['depths']])
+                self.log('Reloaded config %s' % aros.config_hash)
+
+        return line
+
+    # errors from the commands exit, which only ends that command here, and anything else is logged
+    def onecmd(self, line):
+        try:
+            return super().onecmd(line)
+        except SystemExit:
+            return False
+        except Exception as e:
+            self.log('%s: %s' % (type(e).__name__, e), level='error')
+            return False
+
+    def emptyline(self):
+        return False
+
+    def default(self, line):
+        self.log('Invalid command: %s, type help or ? to list commands' % line.split()[0], level='error')
+
+    def do_roll(self, arg):
+        """roll <table path> [count]: rolls on a table, or tallies count rolls of it"""
+        args = arg.split()
+        if not args or len(args) > 2 or (len(args) == 2 and not args[1].isdigit()):
+            self.log('Invalid roll command: needs a table path and an optional count', level='error')
+            return
+
+        if len(args) == 2 and int(args[1]) < 1:
+            self.log('Invalid roll count: %s, must be at least 1' % args[1], level='error')
+            return
+
+        try:
+            table = self.aros.dig(self.ctx, self.aros.config['table'], args[0])
+        except (KeyError, IndexError, TypeError):
+            self.log('Invalid table path: %s' % args[0], level='error')
+            return
+
+        if not rollable(table):
+            self.log('Invalid table path: %s is not a table' % args[0], level='error')
+            return
+
+        if len(args) == 2:
+            self.aros.roll_histogram(self.ctx, label=args[0], table=table, count=int(args[1]))
+        else:
+            self.aros.roll(self.ctx, label=args[0], table=table)
+
+    def complete_roll(self, text, line, begidx, endidx):
+        return complete_from(self.paths, text)
+
+    def do_map(self, arg):
+        """map [depth]: generates the seed's map of a depth, or prints the current map again"""
+        depth = arg.strip()
+        if not depth:
+            if self.map is None:
+                self.log('No map yet, generate one with: map <depth>', level='error')
+                return
+        else:
+            self.aros.validate_depth(depth)
+            self.map_aros = self.aros
+            self.map_ctx = self.aros.context(seed=self.aros.args['seed'])
+            self.map = self.aros.generate_map(self.map_ctx, depth)
+            self.attempts = {}
+
+        self.log('Seed: %s' % self.map.seed)
+        self.map_aros.print_map(self.map)
+
+    def complete_map(self, text, line, begidx, endidx):
+        return complete_from(self.depths, text)
+
+    def do_seed(self, arg):
+        """seed [seed]: shows the seed, or starts the random stream over from a new one"""
+        seed = arg.strip()
+        if seed:
+            self.reseed(seed)
+        self.log('Seed: %s' % self.aros.args['seed'])
+
+    def do_reroll(self, arg):
+        """reroll room <index>: rolls a room of the current map again, keeping its place and hallways"""
+        args = arg.split()
+        if len(args) != 2 or args[0] != 'room' or not args[1].isdigit():
+            self.log('Invalid reroll command: needs room and a room index', level='error')
+            return
+
+        if self.map is None:
+            self.log('No map yet, generate one with: map <depth>', level='error')
+            return
+
+        index = int(args[1])
+        if index >= len(self.map.rooms):
+            self.log('Invalid room: %s, the map has %s rooms' % (index, len(self.map.rooms)), level='error')
+            return
+
+        room = self.map.rooms[index]
+        # fixed rooms have no situation
+        if room.situation is None:
+            self.log('Invalid room: %s is fixed for the depth' % index, level='error')
+            return
+
+        self.map_aros.reroll_room(self.map_ctx, self.map, self.map.depth, room, self.attempts)
+        self.map_aros.print_room_description(room)
+
+    def complete_reroll(self, text, line, begidx, endidx):
+        return complete_from(['room'], text)
+
+    def do_exit(self, arg):
+        """exit: ends the session"""
+        return True
+
+    do_quit = do_exit
+
+    def do_EOF(self, arg):
+        self.stdout.write('\n')
+        return True
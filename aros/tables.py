@@ -0,0 +1,31 @@
+from bisect import bisect_right
+
+class WeightedTable():
+    """A table's entries compiled to cumulative weights, so a die roll maps to an entry with a bisect."""
+    __slots__ = ('entries', 'records', 'cumulative', 'die')
+
+    def __init__(self, entries):
+        self.entries = entries
+        # the entries as dicts, plain names become {'name': name}, shared by every result rolled from them
+        self.records = [entry if isinstance(entry, dict) else {'name': entry} for entry in entries]
+        self.cumulative = []
+
+        # matches the old expansion rule: frequencies only apply to tables of dict entries
+        weighted = isinstance(entries[0], dict)
+
+        total = 0
+        for entry in entries:
+            if weighted and isinstance(entry, dict) and 'frequency' in entry:
+                total += entry['frequency']
+            else:
+                total += 1
+            self.cumulative.append(total)
+
+        self.die = total
+
+    # roll is 0..die-1
+    def entry(self, roll):
+        return self.entries[bisect_right(self.cumulative, roll)]
+
+    def record(self, roll):
+        return self.records[bisect_right(self.cumulative, roll)]
@@ -0,0 +1,154 @@
+import sys
+import time
+import random
+import threading
+from collections import Counter
+
+from .context import StreamRandom
+
+class CountingRandom(random.Random):
+    """A Random that counts its draws, every method of Random draws through getrandbits or random."""
+    def __init__(self, seed, timings):
+        self.timings = timings
+        super().__init__(seed)
+
+    def getrandbits(self, k):
+        self.timings.draws += 1
+        return super().getrandbits(k)
+
+    def random(self):
+        self.timings.draws += 1
+        return super().random()
+
+class CountingStreamRandom(StreamRandom):
+    """A v2 stream that counts its draws, the same way as CountingRandom."""
+    def __init__(self, digest, timings):
+        self.timings = timings
+        super().__init__(digest)
+
+    def getrandbits(self, k):
+        self.timings.draws += 1
+        return super().getrandbits(k)
+
+    def random(self):
+        self.timings.draws += 1
+        return super().random()
+
+class Timings():
+    """Phase timers and call counters for --timings.
+
+    Hooks are installed by wrapping AROS methods on the instance, so nothing is
+    checked or counted when timings are off.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.started = time.perf_counter()
+
+        # phase -> [calls, seconds], recursive calls are counted but only the outermost is timed
+        self.phases = {}
+        self.counts = {}
+        self.draws = 0
+        self.table_names = {}
+
+    def wrap(self, name, func, key=None):
+        phase = self.phases.setdefault(name, [0, 0.0])
+        counts = self.counts.setdefault(name, Counter()) if key else None
+        local = self.local
+
+        def wrapper(*args, **kwargs):
+            if counts is not None:
+                counts[key(*args, **kwargs)] += 1
+
+            depth = getattr(local, name, 0)
+            if depth:
+                phase[0] += 1
+                return func(*args, **kwargs)
+
+            setattr(local, name, 1)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                setattr(local, name, 0)
+                with self.lock:
+                    phase[0] += 1
+                    phase[1] += elapsed
+
+        return wrapper
+
+    def instrument(self, aros):
+        # table entry lists are shared with the config, so their ids name them
+        def walk(table, path):
+            if isinstance(table, list):
+                self.table_names[id(table)] = path
+            elif isinstance(table, dict):
+                if 'entries' in table:
+                    self.table_names[id(table['entries'])] = path
+                else:
+                    for key, value in table.items():
+                        walk(value, '%s.%s' % (path, key) if path else str(key))
+
+        def table_key(ctx, table=[], spread=0, advantage=None):
+            entries = table if isinstance(table, list) else table['entries']
+            if not self.table_names and 'table' in aros.config:
+                walk(aros.config['table'], '')
+            return self.table_names.get(id(entries), '<inline>')
+
+        def dig_key(ctx, data, path):
+            return path
+
+        # table names are looked up again for each instrumented config
+        self.table_names = {}
+
+        phases = ['load_config', 'generate_map', 'depth_first_map', 'roll_room', 'parse_rolls', 'print_map', 'export_map', 'roll']
+        for name in phases:
+            setattr(aros, name, self.wrap(name, getattr(aros, name)))
+        aros.roll_table = self.wrap('roll_table', aros.roll_table, key=table_key)
+        aros.dig = self.wrap('dig', aros.dig, key=dig_key)
+        # compiled roll paths count as digs too
+        aros.resolve_table = self.wrap('dig', aros.resolve_table, key=lambda ctx, path: path.path)
+
+        # instance attributes wrapping its methods, a reloaded copy drops them and is instrumented again
+        self.instrumented = phases + ['roll_table', 'dig', 'resolve_table']
+
+    def random(self, seed):
+        return CountingRandom(seed, self)
+
+    def stream_random(self, digest):
+        return CountingStreamRandom(digest, self)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'elapsed_ms': 1000 * (time.perf_counter() - self.started),
+                'phases': {name: {'calls': calls, 'ms': 1000 * seconds} for name, (calls, seconds) in self.phases.items() if calls},
+                'table_rolls': dict(self.counts['roll_table'].most_common()),
+                'dig_paths': dict(self.counts['dig'].most_common()),
+                'rng_draws': self.draws,
+            }
+
+    def report(self, format='text', file=None):
+        file = file or sys.stderr
+        snapshot = self.snapshot()
+
+        if format == 'json':
+            import json
+
+            print(json.dumps(snapshot, indent=2), file=file)
+            return
+
+        print('Timings (%.1fms total, phase times include the phases they call):' % snapshot['elapsed_ms'], file=file)
+        for name, phase in sorted(snapshot['phases'].items(), key=lambda p: -p[1]['ms']):
+            print('    {0:<20} {1:>8} calls {2:>10.2f}ms'.format(name, phase['calls'], phase['ms']), file=file)
+
+        print('Table rolls:', file=file)
+        for name, count in snapshot['table_rolls'].items():
+            print('    {0:<40} {1:>8}'.format(name, count), file=file)
+
+        print('Dig paths:', file=file)
+        for name, count in snapshot['dig_paths'].items():
+            print('    {0:<40} {1:>8}'.format(name, count), file=file)
+
+        print('RNG draws: %s' % snapshot['rng_draws'], file=file)
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+"""Benchmarks for the generator hot paths, reporting ops/sec and peak memory.
+
+Runs the golden seed check first, since a faster generator that changes
+seeded output is a regression. Save a baseline with --save and compare a
+later run against it with --compare.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+
+from aros.aros import AROS
+from aros.cache import ConfigCache
+
+import golden
+
+CONFIG = os.path.join(os.path.dirname(os.path.realpath(golden.__file__)), '..', 'aros', 'tables.yaml')
+
+def make_aros():
+    old_argv = sys.argv
+    sys.argv = ['aros', 'map', '-l', 'error']
+    try:
+        return AROS()
+    finally:
+        sys.argv = old_argv
+
+def benchmarks(aros):
+    config = aros.config
+    depths = [d['name'] for d in config['depths']]
+    ctx = aros.context(seed='bench')
+    devnull = open(os.devnull, 'w')
+
+    def config_load():
+        ConfigCache(logger=aros.logger).load(CONFIG)
+
+    def config_parse():
+        with open(CONFIG, 'rb') as f:
+            ConfigCache().parse(f.read())
+
+    # frequency weighted tables
+    trap = config['table']['environment']['reef']['trap']
+    melee = config['table']['equipment']['melee_weapon']
+
+    def roll_table():
+        aros.roll_table(ctx, trap)
+        aros.roll_table(ctx, melee, spread=1)
+
+    def roll_die():
+        aros.roll_die(ctx, 20, advantage=2)
+        aros.roll_die(ctx, 6, count=3, advantage=-1)
+
+    def parse_rolls(depth):
+        encounter = config['table']['environment'][depth]['encounter']
+        ctx.vars['depth'] = depth
+
+        def run():
+            result = aros.roll_table(ctx, encounter)[0]
+            aros.parse_rolls(ctx, result, rand=ctx.random)
+        return run
+
+    def command_map(depth):
+        def run():
+            map = aros.generate_map(aros.context(seed='bench%s' % ctx.random.random()), depth)
+            stdout = sys.stdout
+            sys.stdout = devnull
+            try:
+                aros.print_map(map)
+            finally:
+                sys.stdout = stdout
+        return run
+
+    rooms = []
+    for depth in depths:
+        map = aros.generate_map(aros.context(seed='tiles'), depth)
+        rooms.extend([(room, map.hall_mask(room.x, room.y)) for room in map.rooms])
+
+    def print_room_to_lines():
+        for room, halls in rooms:
+            aros.print_room_to_lines(room, halls)
+
+    def print_room_to_lines_cold():
+        aros.renderer.tiles.clear()
+        print_room_to_lines()
+
+    yield 'config_load', config_load
+    yield 'config_parse', config_parse
+    yield 'roll_table', roll_table
+    yield 'roll_die', roll_die
+    for depth in depths:
+        yield 'parse_rolls.%s' % depth, parse_rolls(depth)
+    for depth in depths:
+        yield 'command_map.%s' % depth, command_map(depth)
+    yield 'print_room_to_lines', print_room_to_lines
+    yield 'print_room_to_lines.cold', print_room_to_lines_cold
+
+def measure(func, seconds):
+    func()
+
+    calls = 0
+    started = time.perf_counter()
+    elapsed = 0
+    while elapsed < seconds:
+        func()
+        calls += 1
+        elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {'ops_per_second': calls / elapsed, 'peak_kib': peak / 1024}
+
+def main():
+    parser = argparse.ArgumentParser(description='aros generator benchmarks')
+    parser.add_argument('-t', '--time', default=0.5, type=float, help='seconds to run each benchmark')
+    parser.add_argument('-k', '--filter', default='', help='only run benchmarks whose name contains this')
+    parser.add_argument('--save', default='', help='write the results to this json file')
+    parser.add_argument('--compare', default='', help='compare against results saved with --save')
+    parser.add_argument('--skip_golden', action='store_true', help='skip the golden seed output check')
+    args = parser.parse_args()
+
+    if not args.skip_golden:
+        with open(golden.CORPUS) as f:
+            corpus = json.load(f)
+        changed = [' '.join(argv) for argv in golden.cases() if corpus.get(' '.join(argv)) != golden.run(argv)]
+        if changed:
+            for case in changed:
+                print('changed: aros %s' % case)
+            sys.exit('seeded output changed, run golden.py --update if that was intended')
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    aros = make_aros()
+    results = {}
+    print('{0:<28} {1:>12} {2:>12} {3:>9}'.format('benchmark', 'ops/sec', 'peak KiB', 'vs base'))
+    for name, func in benchmarks(aros):
+        if args.filter not in name:
+            continue
+
+        result = measure(func, args.time)
+        results[name] = result
+
+        ratio = ''
+        if name in baseline:
+            ratio = '%.2fx' % (result['ops_per_second'] / baseline[name]['ops_per_second'])
+        print('{0:<28} {1:>12.1f} {2:>12.1f} {3:>9}'.format(name, result['ops_per_second'], result['peak_kib'], ratio))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
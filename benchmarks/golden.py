@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""Checks that fixed seeds still produce byte-identical output.
+
+Each case runs an aros command in-process and compares the sha256 of its
+stdout with benchmarks/golden.json. Run with --update after a change that is
+meant to alter seeded output, and commit the new corpus with it.
+"""
+import io
+import os
+import sys
+import json
+import hashlib
+import argparse
+import contextlib
+
+from aros.aros import AROS
+
+CORPUS = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'golden.json')
+
+DEPTHS = ['pelagic', 'reef', 'kelp', 'twilight', 'trench']
+SEEDS = ['a', 'awesome_seed', 'qeu9qwdeWNYFWAen', 'stZjDUAzx3T1EOV4']
+TABLES = ['character', 'loot', 'equipment', 'treasure', 'situation', 'environment.kelp.encounter']
+
+def cases():
+    for depth in DEPTHS:
+        for seed in SEEDS:
+            yield ['map', depth, '-s', seed]
+            yield ['map', depth, '-s', seed, '--spread', '1', '-r']
+            yield ['map', depth, '-s', seed, '--rng', 'v2']
+            yield ['room', depth, '5', '-s', seed, '--rng', 'v2']
+
+    for table in TABLES:
+        for seed in SEEDS:
+            yield ['roll', table, '-s', seed]
+            yield ['roll', table, '-s', seed, '--spread', '2', '-r']
+
+def run(argv):
+    out = io.StringIO()
+    old_argv = sys.argv
+    sys.argv = ['aros'] + argv
+    try:
+        with contextlib.redirect_stdout(out):
+            try:
+                AROS().run()
+            except SystemExit:
+                # commands that reject their arguments are part of the corpus too
+                pass
+    finally:
+        sys.argv = old_argv
+
+    return hashlib.sha256(out.getvalue().encode('utf-8')).hexdigest()
+
+def main():
+    parser = argparse.ArgumentParser(description='aros golden seed output check')
+    parser.add_argument('--update', action='store_true', help='rewrite the corpus from the current output')
+    args = parser.parse_args()
+
+    digests = {' '.join(argv): run(argv) for argv in cases()}
+
+    if args.update:
+        with open(CORPUS, 'w') as f:
+            json.dump(digests, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print('wrote %s cases to %s' % (len(digests), CORPUS))
+        return
+
+    with open(CORPUS) as f:
+        golden = json.load(f)
+
+    failed = [case for case in sorted(set(golden) | set(digests)) if golden.get(case) != digests.get(case)]
+    for case in failed:
+        print('changed: aros %s' % case)
+    print('%s of %s cases match' % (len(digests) - len(failed), len(digests)))
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""Checks `aros roll` startup against an import time budget using python -X importtime.
+
+Exits 1 when the best of several runs goes over budget, or when a module that
+`aros roll` should never need gets imported.
+"""
+import sys
+import argparse
+import subprocess
+
+# modules only some commands need, none of them belong on the roll path
+FORBIDDEN = [
+    'pkg_resources',
+    'ruamel',
+    'numpy',
+    'json',
+    'textwrap',
+    'tempfile',
+    'multiprocessing',
+    'http',
+    'fractions',
+]
+
+DEFAULT_ARGS = ['roll', 'loot', '-s', 'startup']
+
+RUN = 'import sys; sys.argv[0] = "aros"; from aros.aros import main; main()'
+
+def parse_importtime(stderr):
+    total = 0
+    modules = set()
+
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        # nested imports are indented under the module that pulled them in
+        if not name[1:].startswith(' '):
+            total += int(cumulative_us)
+        modules.add(name.strip())
+
+    return total, modules
+
+def main():
+    parser = argparse.ArgumentParser(description='aros startup time regression check')
+    parser.add_argument('-b', '--budget', type=float, default=100, help='import time budget in milliseconds')
+    parser.add_argument('-r', '--runs', type=int, default=5, help='runs to take the best of')
+    parser.add_argument('args', nargs='*', default=DEFAULT_ARGS, help='aros arguments to time')
+    args = parser.parse_args()
+
+    best = None
+    for n in range(args.runs):
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', RUN] + args.args, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(proc.stderr, file=sys.stderr)
+            sys.exit('aros %s failed' % ' '.join(args.args))
+
+        total, modules = parse_importtime(proc.stderr)
+        if best is None or total < best:
+            best = total
+
+    ms = best / 1000
+    print('import time: %.1fms (budget %.1fms, best of %s)' % (ms, args.budget, args.runs))
+
+    failed = False
+    imported = sorted(m for m in modules if m.split('.')[0] in FORBIDDEN)
+    if imported and args.args == DEFAULT_ARGS:
+        print('unexpected imports: %s' % ', '.join(imported))
+        failed = True
+    if ms > args.budget:
+        print('over budget by %.1fms' % (ms - args.budget))
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
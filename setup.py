@@ -23,6 +23,9 @@ setup(
         'ruamel.yaml==0.15.100',
         # 'requests==2.20.1',
     ],
+    extras_require = {
+        'numpy': ['numpy'],
+    },
     keywords = 'aros rasp of sand generator',
     license = 'GPL3',
     long_description = read('README.md'),